@@ -0,0 +1,185 @@
+import os
+from itertools import combinations
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+import durations
+from compare import jaccard
+from fileio import write_feather_atomic
+from protocols import protocol_terms
+
+# Bump whenever an aggregate's definition changes, so aggregates cached on disk (and in
+# bundles) under the same table version are recomputed
+ANALYTICS_FORMAT_VERSION = 2
+# Total-duration histogram bins, in hours (1 day, 3 days, 1-12 weeks)
+DURATION_BIN_HOURS = [0, 24, 72, 168, 336, 504, 672, 1008, 1344, 2016, np.inf]
+TOP_GROWTH_FACTORS = 20  # kept per target cell type
+
+ANALYTICS_PREFIX = "analytics-"
+
+class Aggregates(NamedTuple):
+    protocol_stats: pd.DataFrame            # one row per drawable submission: IDs, step_count, total_hours, unspecified_steps
+    growth_factors_by_target: pd.DataFrame  # target, growth_factor, protocols, share
+    step_count_distribution: pd.DataFrame   # step_count, protocols
+    duration_distribution: pd.DataFrame     # duration (bin label), protocols
+    pmid_agreement: pd.DataFrame            # publication_id, annotators, term_jaccard, step_count_match, ...
+
+# ----------------------------
+# Per-protocol facts
+# ----------------------------
+def _protocol_stats(df: pd.DataFrame, summaries: list):
+    """
+    Step counts and total duration per submission that has a protocol (differentiation
+    steps only; the culturing step is not counted). total_hours sums the steps with a
+    parseable duration and is NaN when none has one.
+    """
+    step_rows, step_durations = [], []
+    step_count = np.zeros(len(summaries), dtype=np.int16)
+    for row, summary in enumerate(summaries):
+        for step in summary["steps"]:
+            if step["key"] != "0":
+                step_rows.append(row)
+                step_durations.append(step["duration"])
+                step_count[row] += 1
+
+    hours, _ = durations.normalize_durations(pd.Series(step_durations, dtype=object), min_hours=None)
+    per_step = pd.Series(hours, index=np.asarray(step_rows, dtype=np.intp))
+    all_rows = range(len(summaries))
+    return pd.DataFrame({
+        "publication_id": df["publication_id"].array,
+        "participant_id": df["participant_id"].array,
+        "step_count": step_count,
+        "total_hours": per_step.groupby(level=0).sum(min_count=1).reindex(all_rows).to_numpy(dtype=np.float32),
+        "unspecified_steps": per_step.isna().groupby(level=0).sum().reindex(all_rows, fill_value=0).to_numpy(dtype=np.int16),
+    })
+
+def _term_sets(protocols: list):
+    terms = []
+    for protocol in protocols:
+        try:
+            terms.append(frozenset(protocol_terms(protocol)))
+        except Exception:
+            terms.append(frozenset())
+    return terms
+
+# ----------------------------
+# Aggregate tables
+# ----------------------------
+def _growth_factors_by_target(terms: list):
+    """Most used growth factors per target cell type, with the share of that target's protocols using each."""
+    targets, pairs = [], []
+    for protocol_terms_ in terms:
+        protocol_targets = {t for f, t in protocol_terms_ if f == "target"}
+        growth_factors = {t for f, t in protocol_terms_ if f == "growth_factor"}
+        targets.extend(protocol_targets)
+        pairs.extend((target, gf) for target in protocol_targets for gf in growth_factors)
+    if not pairs:
+        return pd.DataFrame({"target": [], "growth_factor": [], "protocols": [], "share": []})
+
+    counts = pd.DataFrame(pairs, columns=["target", "growth_factor"]).value_counts().rename("protocols").reset_index()
+    per_target = pd.Series(targets, dtype=object).value_counts()
+    counts["share"] = (counts["protocols"] / per_target.reindex(counts["target"]).to_numpy()).astype(np.float32)
+    counts = counts.sort_values(["target", "protocols", "growth_factor"], ascending=[True, False, True])
+    counts = counts.groupby("target", sort=False).head(TOP_GROWTH_FACTORS).reset_index(drop=True)
+    counts["target"] = counts["target"].astype("category")
+    counts["growth_factor"] = counts["growth_factor"].astype("category")
+    counts["protocols"] = pd.to_numeric(counts["protocols"], downcast="integer")
+    return counts
+
+def _step_count_distribution(stats: pd.DataFrame):
+    counts = stats["step_count"].value_counts().sort_index()
+    return pd.DataFrame({"step_count": counts.index.to_numpy(), "protocols": counts.to_numpy()})
+
+def _duration_distribution(stats: pd.DataFrame):
+    hours = stats["total_hours"].dropna()
+    labels = [
+        f"{int(lo)}+ h" if hi == np.inf else f"{int(lo)}-{int(hi)} h"
+        for lo, hi in zip(DURATION_BIN_HOURS[:-1], DURATION_BIN_HOURS[1:])
+    ]
+    binned = pd.cut(hours, DURATION_BIN_HOURS, labels=labels, right=False)
+    counts = binned.value_counts().reindex(labels, fill_value=0)
+    return pd.DataFrame({"duration": pd.Categorical(labels, categories=labels, ordered=True), "protocols": counts.to_numpy()})
+
+def _pmid_agreement(stats: pd.DataFrame, terms: list):
+    """
+    Per PMID with two or more annotators: mean pairwise Jaccard similarity of the
+    searchable term sets (reagents, markers, cells), the fraction of annotator pairs
+    that agree on the step count, and the step count / total duration ranges.
+    """
+    records = []
+    step_counts = stats["step_count"].to_numpy()
+    hours = stats["total_hours"].to_numpy()
+    for pmid, rows in stats.groupby("publication_id", observed=True).indices.items():
+        if len(rows) < 2:
+            continue
+        pairs = list(combinations(rows, 2))
+        known_hours = hours[rows][~np.isnan(hours[rows])]
+        records.append({
+            "publication_id": pmid,
+            "annotators": len(rows),
+            "term_jaccard": float(np.mean([jaccard(terms[a], terms[b], empty=1.0) for a, b in pairs])),
+            "step_count_match": float(np.mean([step_counts[a] == step_counts[b] for a, b in pairs])),
+            "step_count_min": int(step_counts[rows].min()),
+            "step_count_max": int(step_counts[rows].max()),
+            "total_hours_min": float(known_hours.min()) if len(known_hours) else np.nan,
+            "total_hours_max": float(known_hours.max()) if len(known_hours) else np.nan,
+        })
+    agreement = pd.DataFrame.from_records(records, columns=[
+        "publication_id", "annotators", "term_jaccard", "step_count_match",
+        "step_count_min", "step_count_max", "total_hours_min", "total_hours_max",
+    ])
+    return agreement.sort_values(["term_jaccard", "publication_id"]).reset_index(drop=True)
+
+def compute_aggregates(df: pd.DataFrame, protocols: list, summaries: list):
+    """
+    All analytics tables for one table version, from the normalized protocols and
+    summaries of df's rows (in df order); rows without a protocol are left out.
+    Runs once per version; see load_aggregates.
+    """
+    keep = np.array([bool(s) for s in summaries], dtype=bool)
+    df = df[keep]
+    stats = _protocol_stats(df, [s for s, k in zip(summaries, keep) if k])
+    terms = _term_sets([p for p, k in zip(protocols, keep) if k])
+    return Aggregates(
+        protocol_stats=stats,
+        growth_factors_by_target=_growth_factors_by_target(terms),
+        step_count_distribution=_step_count_distribution(stats),
+        duration_distribution=_duration_distribution(stats),
+        pmid_agreement=_pmid_agreement(stats, terms),
+    )
+
+# ----------------------------
+# On-disk cache (one Feather file per table, keyed on the table version)
+# ----------------------------
+def _aggregate_paths(cache_dir: str, version: str):
+    return {name: os.path.join(cache_dir, f"{ANALYTICS_PREFIX}{version}-v{ANALYTICS_FORMAT_VERSION}-{name}.feather") for name in Aggregates._fields}
+
+def load_aggregates(submissions, version: str, cache_dir: str = None):
+    """
+    Aggregates for submissions (datastore.Submissions) at table version, read from
+    cache_dir when they were computed before, else computed and written there.
+    """
+    paths = _aggregate_paths(cache_dir, version) if cache_dir else None
+    if paths and all(os.path.exists(p) for p in paths.values()):
+        try:
+            import pyarrow.feather as feather
+            return Aggregates(**{name: feather.read_table(path).to_pandas() for name, path in paths.items()})
+        except Exception:
+            pass
+
+    labels = submissions.df.index
+    aggregates = compute_aggregates(submissions.df, submissions.protocols.take(labels), submissions.summaries.take(labels))
+
+    if paths:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for name, path in paths.items():
+                write_feather_atomic(getattr(aggregates, name), path)
+            keep = {os.path.basename(p) for p in paths.values()}
+            for name in os.listdir(cache_dir):
+                if name.startswith(ANALYTICS_PREFIX) and name.endswith(".feather") and name not in keep:
+                    os.remove(os.path.join(cache_dir, name))
+        except Exception:
+            pass
+    return aggregates
@@ -0,0 +1,140 @@
+# Cached loaders shared by every page of the app (mainapp.py and pages/*.py).
+# Importing this module draws nothing; the st.cache_resource entries live here so all
+# pages reuse one copy of each table / index per table version.
+# It imports nothing heavy either: datastore (pandas, pyarrow), search and analytics are
+# imported by the loaders that need them, so a fresh replica can draw its first widgets
+# (load_selectors) before those libraries are loaded.
+import os
+import json
+import streamlit as st
+
+import profiling
+import settings
+from selection import SelectionIndex, SelectorLists, input_key
+
+CSV_FILE = settings.CSV_FILE
+# Table versions kept resident per loader (the current one and the one sessions may still be
+# rendering); older versions are evicted, so each CSV or blacklist change does not pin
+# another copy of everything
+VERSIONS_KEPT = settings.VERSIONS_KEPT
+
+# ----------------------------
+# Load base table fast (NO merged_data parsing here)
+# ----------------------------
+# cache_resource: one shared, read-only copy per table version instead of an unpickled
+# copy per rerun, so widget interactions do not pay O(table)
+@st.cache_resource(show_spinner=True, max_entries=VERSIONS_KEPT)
+def _load_submissions_index(csv_file: str, blacklist_path: str, version: str):
+    # version is only part of the cache key: a new CSV/blacklist fingerprint forces a reload
+    import datastore
+    profiling.count("appdata.submissions_index.build")
+    return datastore.load_submissions_index(csv_file, blacklist_path)
+
+@st.cache_resource(show_spinner=True, max_entries=VERSIONS_KEPT)
+def _open_bundle(bundle_dir: str, version: str, _manifest: dict):
+    # opens the files _manifest names, not whatever bundle.json says by now, so the
+    # entry for version never holds another version's rows
+    import datastore
+    profiling.count("appdata.bundle.open")
+    return datastore.open_bundle(bundle_dir, _manifest)
+
+@st.cache_resource(max_entries=VERSIONS_KEPT)
+def _build_selection_index(_df_submitted, version: str):
+    profiling.count("appdata.selection_index.build")
+    return SelectionIndex(_df_submitted)
+
+@st.cache_resource(show_spinner="Indexing reagents and markers...", max_entries=VERSIONS_KEPT)
+def _build_reagent_index(_submissions, version: str):
+    from search import ReagentIndex
+    profiling.count("appdata.reagent_index.build")
+    return ReagentIndex.from_store(_submissions.protocols, _submissions.df.index)
+
+@st.cache_resource(show_spinner="Computing analytics...", max_entries=VERSIONS_KEPT)
+def _load_aggregates(_submissions, version: str, cache_dir: str):
+    import analytics
+    profiling.count("appdata.aggregates.build")
+    return analytics.load_aggregates(_submissions, version, cache_dir)
+
+def current_version(csv_file: str = CSV_FILE):
+    """(blacklist path, table version) for csv_file."""
+    import datastore
+    bl_path = settings.find_blacklist_path()
+    return bl_path, datastore.table_version(csv_file, bl_path)
+
+def _load_table(csv_file: str):
+    """
+    (Submissions, version, cache dir): the prebuilt bundle in settings.BUNDLE_DIR when one
+    is installed (see build_bundle.py), else the table built from csv_file on first use.
+    """
+    import datastore
+    manifest = datastore.read_bundle_manifest(settings.BUNDLE_DIR)
+    if manifest is not None:
+        submissions = _open_bundle(settings.BUNDLE_DIR, manifest["version"], manifest)
+        if submissions is not None:
+            return submissions, manifest["key"], settings.BUNDLE_DIR
+    with profiling.span("appdata.table_version"):
+        bl_path, version = current_version(csv_file)
+    return _load_submissions_index(csv_file, bl_path, version), version, settings.CACHE_DIR
+
+# ----------------------------
+# Selector lists before the table (fast start)
+# ----------------------------
+_built_selectors = {}  # selector key -> SelectionIndex built in this process (latest inputs only)
+
+def selector_location(csv_file: str = CSV_FILE):
+    """
+    (directory, key) of the SelectorLists for the table the app would load, without
+    touching the table: the bundle's when a bundle is installed, else the CSV's in the cache.
+    """
+    try:
+        with open(os.path.join(settings.BUNDLE_DIR, settings.BUNDLE_MANIFEST)) as fh:
+            return settings.BUNDLE_DIR, json.load(fh)["key"]  # build_bundle.py saves the lists under it
+    except (OSError, ValueError, KeyError):
+        return settings.CACHE_DIR, input_key(csv_file, settings.find_blacklist_path())
+
+def load_selectors(csv_file: str = CSV_FILE):
+    """
+    What the PMID / participant selectboxes need, as early as possible: the SelectionIndex
+    this process built for the current inputs, else the SelectorLists saved for them,
+    else None (then call load_submissions_index first).
+    """
+    directory, key = selector_location(csv_file)
+    index = _built_selectors.get(key)
+    if index is not None:
+        return index
+    return SelectorLists.load(directory, key)
+
+def _remember_selectors(csv_file: str, selection_index: SelectionIndex):
+    directory, key = selector_location(csv_file)
+    if _built_selectors.get(key) is selection_index:
+        return
+    _built_selectors.clear()
+    _built_selectors[key] = selection_index
+    lists = SelectorLists.from_index(selection_index)
+    if SelectorLists.load(directory, key) != lists:
+        lists.save(directory, key)
+
+# ----------------------------
+# Public loaders
+# ----------------------------
+def load_submissions_index(csv_file: str = CSV_FILE):
+    """
+    Returns (datastore.Submissions, SelectionIndex, version): the table without merged_data,
+    its raw/normalized/summary stores, the PMID/participant lookups and the table version.
+    The reagent search index is built separately, on first use (load_reagent_index).
+    """
+    with profiling.span("appdata.load_submissions_index"):
+        submissions, version, _ = _load_table(csv_file)
+        selection_index = _build_selection_index(submissions.df, version)
+    _remember_selectors(csv_file, selection_index)
+    return submissions, selection_index, version
+
+def load_reagent_index(csv_file: str = CSV_FILE):
+    """search.ReagentIndex for the current table version, built on first use (the first search)."""
+    submissions, version, _ = _load_table(csv_file)
+    return _build_reagent_index(submissions, version)
+
+def load_aggregates(csv_file: str = CSV_FILE):
+    """analytics.Aggregates for the current table version, computed once per version."""
+    submissions, version, cache_dir = _load_table(csv_file)
+    return _load_aggregates(submissions, version, cache_dir)
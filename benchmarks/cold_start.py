@@ -0,0 +1,176 @@
+# Cold-start benchmark: launches a fresh `streamlit run mainapp.py` per trial (a new
+# replica), connects like a browser over the websocket and times
+#   server_ready   process spawn -> /_stcore/health answers
+#   first_element  first session connects -> first element arrives
+#   first_widget   first session connects -> first input widget (the PMID selectbox) arrives
+#   script_done    first session connects -> the script run finishes
+# time_to_first_widget = server_ready + first_widget is the startup budget to enforce.
+#
+#   python benchmarks/cold_start.py                          # the app's data, as configured
+#   python benchmarks/cold_start.py --scenario bundle --scale 10
+#   python benchmarks/cold_start.py --budget 3               # exit 1 if time_to_first_widget > 3 s
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WIDGET_TYPES = {"selectbox", "multiselect", "checkbox", "button", "text_input", "number_input", "radio", "slider"}
+
+# scenario -> how the replica finds its data (see settings.py)
+SCENARIOS = {
+    "cache": "table cache already on disk (a replica sharing the data volume)",
+    "cold": "empty cache directory: the first session parses the CSV",
+    "bundle": "prebuilt bundle (build_bundle.py) installed",
+}
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_healthy(port: int, process, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError("streamlit did not become healthy")
+
+def _first_session(port: int, timeout: float):
+    """Connects one browser-like session; returns {first_element, first_widget, script_done} seconds after connecting."""
+    from tornado.ioloop import IOLoop
+    from tornado.websocket import websocket_connect
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    async def session():
+        start = time.perf_counter()
+        ws = await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"])
+        rerun = BackMsg()
+        rerun.rerun_script.query_string = ""
+        rerun.rerun_script.page_script_hash = ""
+        await ws.write_message(rerun.SerializeToString(), binary=True)
+        marks = {}
+        while "script_done" not in marks:
+            remaining = timeout - (time.perf_counter() - start)
+            if remaining <= 0:
+                raise TimeoutError("the script run did not finish")
+            data = await ws.read_message()
+            if data is None:
+                raise RuntimeError("websocket closed")
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            now = time.perf_counter() - start
+            if kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                marks.setdefault("first_element", now)
+                if msg.delta.new_element.WhichOneof("type") in WIDGET_TYPES:
+                    marks.setdefault("first_widget", now)
+            elif kind == "script_finished":
+                marks["script_done"] = now
+        ws.close()
+        return marks
+
+    return IOLoop.current().run_sync(session, timeout=timeout + 5)
+
+def run_trial(env: dict, timeout: float = 300.0):
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "mainapp.py"),
+        "--server.headless", "true", "--server.port", str(port), "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false", "--global.developmentMode", "false",
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        _wait_healthy(port, process, timeout)
+        ready = time.perf_counter() - start
+        marks = _first_session(port, timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    result = {"server_ready": ready, **marks}
+    result["time_to_first_widget"] = ready + marks.get("first_widget", marks["script_done"])
+    return result
+
+def prepare(scenario: str, workdir: str, scale: int, seed: int = 0):
+    """Environment for a replica of scenario (data in workdir unless scale is 0)."""
+    env = dict(os.environ)
+    if scale:
+        from synthetic import BASE_ROWS, write_synthetic_csv
+        data_dir = os.path.join(workdir, "data")
+        os.makedirs(data_dir, exist_ok=True)
+        write_synthetic_csv(os.path.join(data_dir, "processed_submissions.csv"), BASE_ROWS * scale, seed)
+        blacklist = os.path.join(ROOT, "data", "participant_blacklist.xlsx")
+        if os.path.exists(blacklist):
+            shutil.copy(blacklist, data_dir)
+        env["EXTRACTOR_DATA_DIR"] = data_dir
+        env.pop("EXTRACTOR_CSV", None)
+    env.pop("EXTRACTOR_BUNDLE", None)
+    env.pop("EXTRACTOR_CACHE_DIR", None)
+    env["EXTRACTOR_BUNDLE"] = os.path.join(workdir, "no-bundle")
+    if scenario == "cold":
+        env["EXTRACTOR_CACHE_DIR"] = os.path.join(workdir, "cold-cache")
+    elif scenario == "bundle":
+        env["EXTRACTOR_BUNDLE"] = os.path.join(workdir, "bundle")
+        subprocess.run([sys.executable, os.path.join(ROOT, "build_bundle.py"), "--out", env["EXTRACTOR_BUNDLE"]],
+                       cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    elif scenario == "cache":
+        run_trial(env)  # one untimed run populates the table cache (and the selector index)
+    return env
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time a fresh app replica to its first widget.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), nargs="+", default=["cache", "bundle"])
+    parser.add_argument("--scale", type=int, default=0, help="synthetic data at this multiple of the real export (default: the configured data)")
+    parser.add_argument("--trials", type=int, default=3, help="fresh replicas per scenario; the median is reported")
+    parser.add_argument("--budget", type=float, help="exit 1 if a scenario's median time_to_first_widget exceeds this many seconds")
+    parser.add_argument("--out", help="write results as JSON here")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="extractor-coldstart-")
+    report, over = {}, []
+    try:
+        for scenario in args.scenario:
+            env = prepare(scenario, workdir, args.scale)
+            trials = []
+            for _ in range(args.trials):
+                if scenario == "cold":
+                    shutil.rmtree(env["EXTRACTOR_CACHE_DIR"], ignore_errors=True)
+                trials.append(run_trial(env))
+            median = {name: statistics.median(t[name] for t in trials) for name in trials[0]}
+            report[scenario] = {"median": median, "trials": trials}
+            print(f"{scenario:<7} " + "  ".join(f"{name} {seconds:6.2f} s" for name, seconds in median.items()))
+            if args.budget is not None and median["time_to_first_widget"] > args.budget:
+                over.append(scenario)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump({"scale": args.scale, "results": report}, fh, indent=2)
+    for scenario in over:
+        print(f"OVER BUDGET {scenario}: {report[scenario]['median']['time_to_first_widget']:.2f} s > {args.budget:.2f} s")
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
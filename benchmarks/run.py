@@ -0,0 +1,205 @@
+# Times each stage of the load / parse / render pipeline on synthetic exports at
+# multiples of the real export size, and records peak memory per stage. Fully offline.
+#
+#   python benchmarks/run.py                         # scales 1, 10, 100
+#   python benchmarks/run.py --scales 10 100 1000    # 1000x is ~440k rows / ~2.6 GB of CSV
+#   python benchmarks/run.py --out base.json
+#   python benchmarks/run.py --baseline base.json    # exit 1 if a stage got slower than --tolerance
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+import datastore
+import durations
+import protocols
+import render
+from analytics import compute_aggregates
+from search import ReagentIndex
+from selection import SelectionIndex
+from synthetic import BASE_ROWS, write_synthetic_csv
+
+PAGE_SIZE = 10
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _html(layouts):
+    """Materializes every HTML fragment a page would emit."""
+    size = 0
+    for layout in layouts:
+        if layout.drawable:
+            size += sum(len(html) for html in layout.cells or ())
+            for step in layout.steps:
+                size += len(step.label_html) + len(step.time_html) + len(step.content_html)
+    return size
+
+def _fragments(layouts):
+    """Builds the single-fragment HTML (render.protocol_html) a page emits in html mode."""
+    return sum(len(render.protocol_html(layout)) for layout in layouts if layout.drawable)
+
+def _measure(func, repeat: int, trace_memory: bool):
+    """Returns (best seconds over repeat runs, tracemalloc peak MB of one more run or None, result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if trace_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+def run_scale(scale: int, workdir: str, repeat: int = 1, trace_memory: bool = True, seed: int = 0, log=print):
+    """Benchmarks every stage on a BASE_ROWS * scale synthetic export; returns a list of result dicts."""
+    rows = BASE_ROWS * scale
+    csv_file = os.path.join(workdir, f"submissions-{scale}x.csv")
+    results = []
+
+    def record(stage, func, repeat_stage=repeat, trace=trace_memory):
+        seconds, peak, result = _measure(func, repeat_stage, trace)
+        results.append({
+            "scale": scale, "rows": rows, "stage": stage, "seconds": round(seconds, 4),
+            "peak_mb": None if peak is None else round(peak, 1),
+            "process_peak_rss_mb": None if _rss_mb() is None else round(_rss_mb(), 1),
+        })
+        log(f"  {stage:<24} {seconds:9.3f} s" + ("" if peak is None else f"   peak {peak:8.1f} MB"))
+        return result
+
+    log(f"{scale}x ({rows} rows)")
+    record("generate_csv", lambda: write_synthetic_csv(csv_file, rows, seed), repeat_stage=1, trace=False)
+
+    def cold_load():
+        cache_dir = tempfile.mkdtemp(dir=workdir)
+        try:
+            return datastore.load_submissions_index(csv_file, "", cache_dir, incremental=False)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    cache_dir = os.path.join(workdir, f"cache-{scale}x")
+    record("load_index_cold", cold_load)
+    datastore.load_submissions_index(csv_file, "", cache_dir)  # populate the on-disk cache
+    submissions = record("load_index_warm", lambda: datastore.load_submissions_index(csv_file, "", cache_dir))
+    record("load_table", lambda: datastore.load_submissions_table(csv_file, "", cache_dir))
+
+    labels = submissions.df.index
+    blobs = submissions.blobs.take(labels)
+    parsed = record("parse_and_normalize", lambda: [protocols.parse_and_normalize_protocol(b) for b in blobs])
+    summaries = record("summarize_protocols", lambda: protocols.summarize_protocols(parsed, workers=1))
+    summaries = [r["summary"] for r in summaries]
+    del blobs
+
+    step_durations = pd.Series([step["duration"] for s in summaries if s for step in s["steps"]], dtype=object)
+    record("normalize_durations", lambda: durations.normalize_durations(step_durations))
+
+    summary_store = submissions.summaries
+    page = range(min(PAGE_SIZE, len(submissions.df)))
+    record("render_page_html", lambda: _html(render.layout_rows(submissions.df, summary_store, page)), repeat_stage=max(repeat, 5))
+    record("render_page_fragment", lambda: _fragments(render.layout_rows(submissions.df, summary_store, page)), repeat_stage=max(repeat, 5))
+    record("render_all_html", lambda: _html(render.layout_rows(submissions.df, summary_store, range(len(submissions.df)))))
+
+    record("selection_index", lambda: SelectionIndex(submissions.df))
+    record("reagent_index", lambda: ReagentIndex(parsed))
+    record("analytics", lambda: compute_aggregates(submissions.df, parsed, summaries))
+
+    os.remove(csv_file)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+def environment():
+    import numpy
+    try:
+        import pyarrow
+        pyarrow_version = pyarrow.__version__
+    except ImportError:
+        pyarrow_version = None
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": protocols.default_workers(),
+        "pandas": pd.__version__,
+        "numpy": numpy.__version__,
+        "pyarrow": pyarrow_version,
+    }
+
+def regressions(results: list, baseline: list, tolerance: float, min_seconds: float = 0.05):
+    """(scale, stage, before, after) for stages more than tolerance slower than baseline (tiny stages ignored)."""
+    before = {(r["scale"], r["stage"]): r["seconds"] for r in baseline}
+    slower = []
+    for r in results:
+        old = before.get((r["scale"], r["stage"]))
+        if old is not None and max(old, r["seconds"]) >= min_seconds and r["seconds"] > old * (1 + tolerance):
+            slower.append((r["scale"], r["stage"], old, r["seconds"]))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the load / parse / render pipeline on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help=f"multiples of {BASE_ROWS} rows (default: 1 10 100)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is reported")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass (halves the run time)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where to write the synthetic CSVs (default: a temporary directory)")
+    parser.add_argument("--out", help="write results as JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs --baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="extractor-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for scale in args.scales:
+            results.extend(run_scale(scale, workdir, args.repeat, not args.no_memory, args.seed))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(), "results": results}
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            slower = regressions(results, json.load(fh)["results"], args.tolerance)
+        for scale, stage, old, new in slower:
+            print(f"REGRESSION {scale}x {stage}: {old:.3f} s -> {new:.3f} s")
+        if slower:
+            return 1
+        print(f"no stage slower than baseline by more than {args.tolerance:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
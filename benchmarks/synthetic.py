@@ -0,0 +1,99 @@
+# Synthetic submissions exports for benchmarking: same columns and the same nested
+# merged_data format as data/submissions.csv / data/processed_submissions.csv (a Python
+# dict repr of step key -> JSON string), generated from fixed vocabularies with a seeded
+# RNG, so runs are reproducible and need no network or real data.
+import json
+import random
+import pandas as pd
+
+BASE_ROWS = 442  # size of the real export the scales are relative to
+
+MEDIA = ["DMEM/F12", "Neurobasal medium", "mTeSR1", "E8 medium", "RPMI 1640", "StemSpan SFEM II", "KnockOut DMEM", "IMDM", "Advanced DMEM/F12", "StemPro-34"]
+SUPPLEMENTS = ["B-27 supplement", "N2 supplement", "GlutaMAX", "KnockOut Serum Replacement", "FBS", "penicillin-streptomycin", "2-mercaptoethanol", "nonessential amino acids", "insulin-transferrin-selenium", "ascorbic acid", "human albumin", "heparin"]
+GROWTH_FACTORS = ["CHIR99021", "bFGF", "BMP4", "Activin A", "SB431542", "LDN193189", "FGF8", "SHH", "retinoic acid", "VEGF", "IWP2", "Noggin", "EGF", "BDNF", "GDNF", "TGF-β1", "Y-27632", "DAPT", "purmorphamine", "XAV939"]
+MATRICES = ["Matrigel", "Geltrex", "laminin-521", "vitronectin", "poly-L-ornithine", "gelatin", "fibronectin", "Not given"]
+MARKERS = ["NKX2-5", "TNNT2", "SOX17", "FOXA2", "PAX6", "SOX1", "OCT4", "NANOG", "SOX2", "TH", "LMX1A", "ISL1", "MAP2", "GATA4", "AFP", "ALB", "CD34", "CD31", "PDX1", "NKX6-1", "T", "MIXL1", "HAND1", "OLIG2"]
+CELL_LINES = ["H9", "H1", "HUES8", "WTC-11", "IMR90-4", "KOLF2.1J", "iPS(IMR90)-4", "BJ-iPSC", "NCRM-5", "SFC840"]
+TARGETS = ["cardiomyocytes", "definitive endoderm", "hepatocytes", "motor neurons", "dopaminergic neurons", "cortical neurons", "pancreatic beta cells", "endothelial cells", "hematopoietic progenitors", "astrocytes"]
+# the real mix: bare hours, units, ranges, words, and plenty of placeholders
+DURATIONS = ["24", "48", "72", "96", "168", "120", "144", "48 hours", "24 hours", "24h", "2 days", "7 days", "3 days", "10 days", "14 days", "48-72", "3-5 hours", "3-5 days", "Day 3-5", "two weeks", "Overnight", "Not specified", "not given", "NA", "-", "", None]
+VENDORS = ["Thermo Fisher", "STEMCELL Technologies", "PeproTech", "R&D Systems", "Sigma-Aldrich", "Corning", "Miltenyi", "Tocris", "Not Given"]
+STATUSES = ["submitted"] * 30 + ["assigned", "in_progress"]
+
+def _reagents(rng: random.Random, pool: list, k_max: int, amount_key: str):
+    items = []
+    for name in rng.sample(pool, rng.randint(1, k_max)):
+        item = {"name": name, "vendor": rng.choice(VENDORS), "catalogNumber": f"{rng.randint(1000, 99999)}"}
+        item[amount_key] = f"{rng.choice([1, 2, 5, 10, 20, 50, 100])} ng/ml" if amount_key == "finalConcentration" else rng.choice(["1:1", "1%", "2%", "10%", "Not Given"])
+        if amount_key == "finalConcentration":
+            item["unit"] = "ng/ml"
+        items.append(item)
+    return items
+
+def _step(rng: random.Random, culturing: bool = False):
+    step = {}
+    if culturing:
+        step["culturingProtocol"] = [{"isGiven": rng.random() < 0.7}]
+    step["duration"] = [{"durationType": rng.choice(["Hours", "Not Specified", "Overnight"]), "durationHours": rng.choice(DURATIONS)}]
+    step["basalMedia"] = _reagents(rng, MEDIA, 2, "mixtureRatio")
+    step["SerumAndSupplements"] = _reagents(rng, SUPPLEMENTS, 4, "mixtureRatio")
+    growth_factors = _reagents(rng, GROWTH_FACTORS, 4, "finalConcentration")
+    # a few exports store a single entry as a bare dict instead of a one-item list
+    step["growthFactor"] = growth_factors[0] if len(growth_factors) == 1 and rng.random() < 0.05 else growth_factors
+    step["cultureMatrix"] = [{"name": rng.choice(MATRICES), "vendor": rng.choice(VENDORS), "catalogNumber": "Not Given", "mixtureRatio": "Not Given"}]
+    step["passaging"] = [{"cellsPassaged": rng.random() < 0.3}]
+    step["passagingMedia"] = [{"name": None, "vendor": None, "catalogNumber": None, "mixtureRatio": None}]
+    if not culturing:
+        step["readout"] = [{"readoutInformation": rng.random() < 0.5}]
+        step["geneMarkers"] = [
+            {"name": name, "geneEnrichment": rng.choice(["upregulated", "upregulated", "downregulated", None]), "positiveCells": None}
+            for name in rng.sample(MARKERS, rng.randint(1, 4))
+        ]
+    return step
+
+def synthetic_blob(rng: random.Random):
+    """One merged_data string: {'0': '<json>', '1': '<json>', ..., 'sequencingData': ..., 'cellLine': ...}."""
+    n_steps = min(20, 1 + int(rng.expovariate(0.45)) + 1)
+    blob = {"0": json.dumps(_step(rng, culturing=True), separators=(",", ":"))}
+    for i in range(1, n_steps + 1):
+        blob[str(i)] = json.dumps(_step(rng), separators=(",", ":"))
+    blob["sequencingData"] = json.dumps({
+        "sequencing": [{"sequencingDataIsAvailable": rng.random() < 0.2}],
+        "sequencingData": [{"sequencingDataType": None, "dataAccessId": None}],
+    }, separators=(",", ":"))
+    blob["cellLine"] = json.dumps({
+        "cellLineDetails": [{"cellLineType": rng.choice(["ESC", "iPSC"]), "cellLineName": name} for name in rng.sample(CELL_LINES, rng.randint(1, 2))],
+        "differentiationTarget": [{"targetCell": rng.choice(TARGETS)}],
+    }, separators=(",", ":"))
+    return repr(blob)
+
+def synthetic_submissions(n_rows: int, seed: int = 0, start: int = 0):
+    """
+    DataFrame shaped like the real export (participant_id, fullName, publication_id,
+    status, assignment_id, merged_data) with n_rows rows; start offsets row numbers so
+    chunks of one dataset can be generated separately.
+    """
+    n_participants = max(46, n_rows // 10 + 1)
+    n_pmids = max(124, n_rows * 2 // 7 + 1)
+    records = []
+    for i in range(start, start + n_rows):
+        rng = random.Random(f"{seed}:{i}")
+        participant = rng.randrange(n_participants)
+        records.append({
+            "participant_id": 10**17 + participant * 7919,
+            "fullName": f"Annotator {participant}",
+            "publication_id": 18000000 + rng.randrange(n_pmids) * 173,
+            "status": rng.choice(STATUSES),
+            "assignment_id": i,
+            # a sliver of empty blobs, as in partially filled submissions
+            "merged_data": "" if rng.random() < 0.003 else synthetic_blob(rng),
+        })
+    return pd.DataFrame.from_records(records)
+
+def write_synthetic_csv(path: str, n_rows: int, seed: int = 0, chunk_rows: int = 5000):
+    """Writes a synthetic export of n_rows rows to path in chunks (bounded memory at any scale)."""
+    for start in range(0, n_rows, chunk_rows):
+        chunk = synthetic_submissions(min(chunk_rows, n_rows - start), seed, start)
+        chunk.index = range(start, start + len(chunk))
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0)
+    return path
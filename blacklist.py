@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import hashlib
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+import profiling
+from fileio import atomic_write
+from settings import find_blacklist_path  # where the workbook is looked for is configured in settings
+
+# ----------------------------
+# ID normalization
+# ----------------------------
+def _safe_str(x):
+    if pd.isna(x):
+        return None
+    try:
+        if isinstance(x, (int, np.integer)):
+            return str(int(x))
+        if isinstance(x, float) and x.is_integer():
+            return str(int(x))
+    except Exception:
+        pass
+    return str(x).strip()
+
+def normalize_ids(values: pd.Series):
+    """
+    _safe_str for a whole column, as a categorical with sorted str categories.
+    IDs repeat heavily, so each distinct value is normalized once and rows only keep
+    a small integer code; missing IDs stay missing.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    labels = pd.Index([_safe_str(u) for u in uniques], dtype=object)
+    categories = pd.Index(sorted(labels.unique()), dtype=object)
+    remap = categories.get_indexer(labels)
+    codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+
+# ----------------------------
+# Workbook parsing (openpyxl; only runs when the compiled rules are stale)
+# ----------------------------
+@profiling.timed("blacklist.load_blacklists")
+def load_blacklists(excel_path: str):
+    remove_all_participants = set()
+    remove_pairs = set()      # (participant_id_str, pmid_str)
+    remove_pmids_full = set() # pmid_str
+
+    if not excel_path or not os.path.exists(excel_path):
+        return remove_all_participants, remove_pairs, remove_pmids_full
+
+    # Sheet1: participant_id + submissionsToRemove (PMIDs or 'all')
+    try:
+        sheet1 = pd.read_excel(excel_path, sheet_name="Sheet1")
+        if "participant_id" in sheet1.columns and "submissionsToRemove" in sheet1.columns:
+            pids = sheet1["participant_id"].map(_safe_str)
+            subs = sheet1["submissionsToRemove"].map(_safe_str)
+            rows = pids.notna() & subs.notna() & (pids != "") & (subs != "")
+            pids, subs = pids[rows], subs[rows]
+
+            is_all = subs.str.lower() == "all"
+            remove_all_participants.update(pids[is_all])
+            pmids = subs[~is_all].str.findall(r"\d+").explode().dropna()
+            remove_pairs.update(zip(pids[pmids.index], pmids))
+    except Exception:
+        pass
+
+    # Sheet2: PMIDs to remove fully (first column)
+    try:
+        sheet2 = pd.read_excel(excel_path, sheet_name="Sheet2", header=None)
+        for v in sheet2.iloc[:, 0].dropna().tolist():
+            pmid = _safe_str(v)
+            if pmid and re.fullmatch(r"\d+", pmid):
+                remove_pmids_full.add(pmid)
+    except Exception:
+        pass
+
+    return remove_all_participants, remove_pairs, remove_pmids_full
+
+# ----------------------------
+# Compiled rule set
+# ----------------------------
+class BlacklistRules(NamedTuple):
+    participants: frozenset   # participant IDs removed entirely
+    pmids: frozenset          # PMIDs removed entirely
+    pairs: frozenset          # (participant ID, PMID) submissions removed
+
+    @classmethod
+    def empty(cls):
+        return cls(frozenset(), frozenset(), frozenset())
+
+    def to_json(self):
+        return {
+            "participants": sorted(self.participants),
+            "pmids": sorted(self.pmids),
+            "pairs": sorted([list(p) for p in self.pairs]),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            frozenset(data["participants"]),
+            frozenset(data["pmids"]),
+            frozenset(tuple(p) for p in data["pairs"]),
+        )
+
+_rules_memo = {}  # (abspath, mtime_ns, size) -> BlacklistRules
+
+def compile_blacklist(excel_path: str, cache_dir: str = None):
+    """
+    Returns the BlacklistRules in excel_path (empty when there is no workbook).
+    Compiled once per workbook mtime/size in this process, and, with cache_dir, once per
+    workbook content across processes (as blacklist-<sha>.json), so openpyxl only runs
+    after the workbook is edited.
+    """
+    if not excel_path or not os.path.exists(excel_path):
+        return BlacklistRules.empty()
+    st_ = os.stat(excel_path)
+    memo_key = (os.path.abspath(excel_path), st_.st_mtime_ns, st_.st_size)
+    rules = _rules_memo.get(memo_key)
+    if rules is not None:
+        profiling.count("blacklist.compiled.memo_hit")
+        return rules
+
+    compiled_path = None
+    if cache_dir:
+        with open(excel_path, "rb") as fh:
+            digest = hashlib.sha256(fh.read()).hexdigest()[:16]
+        compiled_path = os.path.join(cache_dir, f"blacklist-{digest}.json")
+        try:
+            with open(compiled_path) as fh:
+                rules = BlacklistRules.from_json(json.load(fh))
+            profiling.count("blacklist.compiled.disk_hit")
+        except (OSError, ValueError, KeyError):
+            rules = None
+
+    if rules is None:
+        participants, pairs, pmids = load_blacklists(excel_path)
+        rules = BlacklistRules(frozenset(participants), frozenset(pmids), frozenset(pairs))
+        if compiled_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with atomic_write(compiled_path, "w") as fh:
+                    json.dump(rules.to_json(), fh)
+                for name in os.listdir(cache_dir):
+                    if name.startswith("blacklist-") and name.endswith(".json") and name != os.path.basename(compiled_path):
+                        os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    _rules_memo[memo_key] = rules
+    return rules
+
+# ----------------------------
+# Applying rules
+# ----------------------------
+@profiling.timed("blacklist.apply_blacklist")
+def apply_blacklist(df: pd.DataFrame, rules: BlacklistRules):
+    """
+    Drops blacklisted rows from df (IDs already normalized to str) with vectorized
+    membership tests; the index is kept, so row labels still address the blob stores.
+    Returns (filtered df, report) where report lists every rule with the number of rows
+    it removed. Rules apply in order PMID, participant, pair; a row counts for the first
+    rule that matches it.
+    """
+    pmid_hit = df["publication_id"].isin(rules.pmids)
+    participant_hit = ~pmid_hit & df["participant_id"].isin(rules.participants)
+    pair_hit = ~pmid_hit & ~participant_hit
+    if rules.pairs:
+        pair_hit &= pd.MultiIndex.from_arrays([df["participant_id"], df["publication_id"]]).isin(list(rules.pairs))
+    else:
+        pair_hit &= False
+
+    pmid_counts = df.loc[pmid_hit, "publication_id"].value_counts()
+    participant_counts = df.loc[participant_hit, "participant_id"].value_counts()
+    pair_counts = df.loc[pair_hit].groupby(["participant_id", "publication_id"], observed=True).size()
+
+    report = (
+        [{"kind": "pmid", "rule": pmid, "rows_removed": int(pmid_counts.get(pmid, 0))} for pmid in sorted(rules.pmids)]
+        + [{"kind": "participant", "rule": pid, "rows_removed": int(participant_counts.get(pid, 0))} for pid in sorted(rules.participants)]
+        + [{"kind": "pair", "rule": f"{pid} / {pmid}", "rows_removed": int(pair_counts.get((pid, pmid), 0))} for pid, pmid in sorted(rules.pairs)]
+    )
+    return df[~(pmid_hit | participant_hit | pair_hit)], report
@@ -0,0 +1,56 @@
+# Offline pre-processor: compiles the submissions export into a ready-to-serve bundle
+# (filtered + blacklisted index table, raw / normalized / summary stores with step lengths
+# and labels, precomputed analytics, bundle.json). The app opens the bundle at startup
+# instead of parsing the CSV; run this in the nightly pipeline.
+#
+#   python build_bundle.py                                    # data/processed_submissions.csv -> data/bundle
+#   python build_bundle.py export.csv --blacklist bl.xlsx --out /srv/extractor/bundle
+#   python build_bundle.py --workers 32                       # default: every core (or EXTRACTOR_WORKERS)
+#
+# The app reads the bundle from data/bundle, or from EXTRACTOR_BUNDLE when set (see settings.py).
+import os
+import sys
+import time
+import argparse
+
+import datastore
+import analytics
+import protocols
+import settings
+from blacklist import find_blacklist_path
+from selection import SelectionIndex, SelectorLists
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the submissions CSV into a bundle the app opens at startup.")
+    parser.add_argument("csv", nargs="?", default=settings.CSV_FILE, help=f"submissions export (default: {settings.CSV_FILE})")
+    parser.add_argument("--blacklist", help="participant blacklist workbook (default: the one the app would find)")
+    parser.add_argument("--no-blacklist", action="store_true", help="keep every submitted row")
+    parser.add_argument("--out", default=datastore.BUNDLE_DIR, help=f"bundle directory (default: {datastore.BUNDLE_DIR})")
+    parser.add_argument("--workers", type=int, default=protocols.default_workers(), help="normalization processes (default: %(default)s)")
+    parser.add_argument("--no-analytics", action="store_true", help="skip precomputing the analytics page")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.csv):
+        parser.error(f"no such file: {args.csv}")
+    blacklist_path = None if args.no_blacklist else (args.blacklist or find_blacklist_path())
+    if blacklist_path and not os.path.exists(blacklist_path):
+        parser.error(f"no such file: {blacklist_path}")
+
+    start = time.perf_counter()
+    submissions, manifest = datastore.build_bundle(args.csv, blacklist_path, args.out, args.workers)
+    print(f"bundle {manifest['version']}: {manifest['rows']} rows ({manifest['parse_errors']} unparsable) "
+          f"in {time.perf_counter() - start:.1f} s with {args.workers} workers")
+    # what the app draws its selectors from before opening the bundle
+    SelectorLists.from_index(SelectionIndex(submissions.df)).save(args.out, manifest["key"])
+    removed = sum(rule["rows_removed"] for rule in manifest["blacklist_report"])
+    print(f"blacklist: {len(manifest['blacklist_report'])} rules, {removed} rows removed ({blacklist_path or 'none'})")
+
+    if not args.no_analytics:
+        start = time.perf_counter()
+        analytics.load_aggregates(submissions, manifest["key"], args.out)
+        print(f"analytics in {time.perf_counter() - start:.1f} s")
+    print(f"written to {os.path.abspath(args.out)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
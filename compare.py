@@ -0,0 +1,214 @@
+from dataclasses import dataclass, field
+from itertools import combinations
+import numpy as np
+import pandas as pd
+
+import durations
+from protocols import step_entries
+
+# Fields compared per aligned step: (entry field, heading); "duration" is compared on parsed hours
+COMPARE_FIELDS = [
+    ("duration", "Duration"),
+    ("media", "Basal media"),
+    ("supplement", "Serum and supplements"),
+    ("growth_factor", "Growth factors"),
+    ("matrix", "Culture matrix"),
+    ("marker", "Readout"),
+]
+
+# ----------------------------
+# Comparison model
+# ----------------------------
+@dataclass
+class StepEntry:
+    """One annotator's step in an aligned row."""
+    key: str                 # step key in that annotator's protocol ("0" = culturing)
+    time_label: str
+    hours: float             # parsed duration, NaN when not given
+    entries: dict            # field -> [(name, term), ...] (see protocols.step_entries)
+
+    def terms(self, name: str):
+        if name == "duration":
+            return frozenset() if np.isnan(self.hours) else frozenset([round(self.hours, 2)])
+        return frozenset(term for _, term in self.entries.get(name, []))
+
+@dataclass
+class AlignedRow:
+    label: str                                      # "Culturing" / "Step 2" (reference numbering)
+    steps: dict = field(default_factory=dict)       # column -> StepEntry, missing when that annotator has no such step
+    agreement: dict = field(default_factory=dict)   # field -> True/False; None when fewer than two annotators have the step
+
+@dataclass
+class Comparison:
+    pmid: str
+    columns: list            # annotator column labels (participant IDs; repeats get "#2", ...)
+    rows: list               # AlignedRow, in timeline order
+    warnings: list = field(default_factory=list)
+    field_agreement: dict = field(default_factory=dict)   # field -> share of comparable rows where all annotators agree
+    field_similarity: dict = field(default_factory=dict)  # field -> mean pairwise Jaccard over comparable rows
+
+    def agreement_table(self):
+        return pd.DataFrame({
+            "field": [heading for _, heading in COMPARE_FIELDS],
+            "rows_agreeing": [self.field_agreement.get(name) for name, _ in COMPARE_FIELDS],
+            "mean_similarity": [self.field_similarity.get(name) for name, _ in COMPARE_FIELDS],
+        })
+
+# ----------------------------
+# Step alignment
+# ----------------------------
+def jaccard(a: frozenset, b: frozenset, empty: float = 0.0):
+    """|a & b| / |a | b|; empty when both sets are empty (no evidence either way)."""
+    union = len(a | b)
+    return len(a & b) / union if union else empty
+
+def _step_similarity(a: StepEntry, b: StepEntry):
+    if (a.key == "0") != (b.key == "0"):
+        return -np.inf  # culturing only lines up with culturing
+    all_a = frozenset((name, t) for name, _ in COMPARE_FIELDS for t in a.terms(name))
+    all_b = frozenset((name, t) for name, _ in COMPARE_FIELDS for t in b.terms(name))
+    # the small constant makes "match" beat "gap" on ties, so equal-length protocols line up step by step
+    return jaccard(all_a, all_b) + 0.01
+
+def align_steps(reference: list, steps: list):
+    """
+    Global (Needleman-Wunsch) alignment of steps onto reference by reagent/marker overlap,
+    with free gaps. Returns [(reference index or None, steps index or None), ...] in order.
+    """
+    n, m = len(reference), len(steps)
+    score = np.zeros((n + 1, m + 1))
+    move = np.zeros((n + 1, m + 1), dtype=np.int8)  # 0 diagonal, 1 up (gap in steps), 2 left (gap in reference)
+    move[1:, 0] = 1
+    move[0, 1:] = 2
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            options = (
+                score[i - 1, j - 1] + _step_similarity(reference[i - 1], steps[j - 1]),
+                score[i - 1, j],
+                score[i, j - 1],
+            )
+            move[i, j] = int(np.argmax(options))
+            score[i, j] = options[move[i, j]]
+
+    pairs = []
+    i, j = n, m
+    while i or j:
+        if move[i, j] == 0:
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif move[i, j] == 1:
+            pairs.append((i - 1, None))
+            i -= 1
+        else:
+            pairs.append((None, j - 1))
+            j -= 1
+    return pairs[::-1]
+
+# ----------------------------
+# Batched comparison
+# ----------------------------
+def _step_entries(protocol: dict, summary: dict):
+    steps = []
+    for step in summary["steps"]:
+        step_data = protocol.get(str(step["key"])) if protocol else None
+        entries = step_entries(step_data) if isinstance(step_data, dict) else {}
+        steps.append(StepEntry(step["key"], step["time_label"], np.nan, entries))
+    return steps
+
+def _row_label(step: StepEntry, ordinal: int):
+    return "Culturing" if step.key == "0" else f"Step {ordinal}"
+
+def compare_submissions(pmid, participant_ids, protocols: list, summaries: list, errors: list = None):
+    """
+    Aligns the steps of every submission for one PMID (participant_ids, protocols and
+    summaries are parallel lists, e.g. from one .take over the PMID's rows) and scores
+    per-field agreement. The annotator with the most steps is the reference timeline;
+    steps another annotator adds get their own rows.
+    """
+    errors = errors or [None] * len(summaries)
+    columns, timelines, warnings = [], [], []
+    seen = {}
+    for participant, protocol, summary, error in zip(participant_ids, protocols, summaries, errors):
+        if not summary:
+            if error:
+                warnings.append(f"Participant ID {participant}: {error}")
+            continue
+        seen[participant] = seen.get(participant, 0) + 1
+        columns.append(str(participant) if seen[participant] == 1 else f"{participant} #{seen[participant]}")
+        timelines.append(_step_entries(protocol, summary))
+
+    # one vectorized duration pass over every step of every annotator
+    all_steps = [step for timeline in timelines for step in timeline]
+    if all_steps:
+        raw = [summary_step["duration"] for summary in summaries if summary for summary_step in summary["steps"]]
+        hours, _ = durations.normalize_durations(pd.Series(raw, dtype=object), min_hours=None)
+        for step, h in zip(all_steps, hours.tolist()):
+            step.hours = h
+
+    comparison = Comparison(pmid, columns, [], warnings)
+    if not timelines:
+        return comparison
+
+    reference_column = max(range(len(timelines)), key=lambda c: len(timelines[c]))
+    reference = timelines[reference_column]
+
+    # grid slots: (reference index, insertion number); insertions follow the reference step they come after
+    slots = {(i, 0): {reference_column: step} for i, step in enumerate(reference)}
+    for column, timeline in enumerate(timelines):
+        if column == reference_column:
+            continue
+        previous, inserted = -1, 0
+        for ref_index, own_index in align_steps(reference, timeline):
+            if ref_index is not None:
+                previous, inserted = ref_index, 0
+                if own_index is not None:
+                    slots[(ref_index, 0)][column] = timeline[own_index]
+            else:
+                inserted += 1
+                slots.setdefault((previous, inserted), {})[column] = timeline[own_index]
+
+    ordinal = 0
+    for slot in sorted(slots):
+        cells = slots[slot]
+        anchor = reference[slot[0]] if slot[1] == 0 else next(iter(cells.values()))
+        if slot[1] == 0:
+            if anchor.key != "0":
+                ordinal += 1
+            label = _row_label(anchor, ordinal)
+        elif anchor.key == "0":
+            label = "Culturing"
+        elif slot[0] < 0:
+            label = "Extra step (before the first)"
+        else:
+            label = f"Extra step after {_row_label(reference[slot[0]], ordinal)}"
+        row = AlignedRow(label, {columns[c]: step for c, step in sorted(cells.items())})
+        for name, _ in COMPARE_FIELDS:
+            present = list(row.steps.values())
+            row.agreement[name] = None if len(present) < 2 else len({step.terms(name) for step in present}) == 1
+        comparison.rows.append(row)
+
+    # per-field scores over rows that at least two annotators filled
+    for name, _ in COMPARE_FIELDS:
+        agreeing = [row.agreement[name] for row in comparison.rows if row.agreement[name] is not None]
+        similarity = [
+            jaccard(a.terms(name), b.terms(name), empty=1.0)
+            for row in comparison.rows if len(row.steps) > 1
+            for a, b in combinations(row.steps.values(), 2)
+        ]
+        comparison.field_agreement[name] = float(np.mean(agreeing)) if agreeing else None
+        comparison.field_similarity[name] = float(np.mean(similarity)) if similarity else None
+    return comparison
+
+def compare_pmid(df: pd.DataFrame, rows, protocols_store, summary_store, error_column: str = "parse_error"):
+    """
+    compare_submissions for the row positions of one PMID in df, fetching every
+    submission's protocol and summary in one batched .take per store.
+    """
+    rows = [int(r) for r in rows]
+    labels = df.index[rows]
+    subset = df.iloc[rows]
+    errors = subset[error_column].tolist() if error_column in df.columns else None
+    pmid = subset["publication_id"].iloc[0] if rows else None
+    return compare_submissions(
+        pmid, subset["participant_id"].tolist(), protocols_store.take(labels), summary_store.take(labels), errors
+    )
@@ -0,0 +1,535 @@
+import io
+import os
+import json
+import pickle
+import hashlib
+from typing import NamedTuple
+import pandas as pd
+
+import protocols
+import profiling
+import settings
+from fileio import atomic_write, write_feather_atomic
+from blacklist import apply_blacklist, compile_blacklist, find_blacklist_path, normalize_ids
+
+# Bump whenever the filtering, normalization or cache layout changes, so stale on-disk tables are ignored.
+TABLE_FORMAT_VERSION = 6
+
+CACHE_DIR = settings.CACHE_DIR
+
+TEST_PARTICIPANTS = [
+    1246060743644676199,
+    753972611481993256,
+    204295234522185728,
+]
+
+# ----------------------------
+# File fingerprints
+# ----------------------------
+_hash_memo = {}  # (path, mtime_ns, size) -> sha256 hex
+
+def file_fingerprint(path):
+    """
+    Returns {"mtime_ns", "size", "sha256"} for path, or None if it does not exist.
+    The hash is memoized on (path, mtime_ns, size) so repeated calls only stat the file.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    st_ = os.stat(path)
+    memo_key = (os.path.abspath(path), st_.st_mtime_ns, st_.st_size)
+    digest = _hash_memo.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _hash_memo[memo_key] = digest
+    return {"mtime_ns": st_.st_mtime_ns, "size": st_.st_size, "sha256": digest}
+
+def _scan_csv(csv_file: str, keep_from: int = None):
+    """
+    One pass over csv_file up to and including its last newline (a partly written last
+    line is left for a later load). Returns (header, size, sha256 hex, kept): the header
+    line, the number of bytes covered, their hash and, when keep_from is given, the
+    covered bytes from keep_from on.
+    """
+    h = hashlib.sha256()
+    header, size, pending, kept = b"", 0, b"", []
+    with open(csv_file, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            chunk = pending + chunk
+            cut = chunk.rfind(b"\n") + 1
+            lines, pending = chunk[:cut], chunk[cut:]
+            if not header and lines:
+                header = lines[:lines.index(b"\n") + 1]
+            h.update(lines)
+            if keep_from is not None and size + len(lines) > keep_from:
+                kept.append(lines[max(0, keep_from - size):])
+            size += len(lines)
+    return header, size, h.hexdigest(), b"".join(kept)
+
+_csv_memo = {}  # (path, mtime_ns, size) -> {"size", "sha256"} of its complete lines
+
+def csv_fingerprint(path):
+    """
+    Returns {"size", "sha256"} of the complete lines of path (see _scan_csv), or None if it
+    does not exist. Memoized like file_fingerprint.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    st_ = os.stat(path)
+    memo_key = (os.path.abspath(path), st_.st_mtime_ns, st_.st_size)
+    fingerprint = _csv_memo.get(memo_key)
+    if fingerprint is None:
+        _, size, digest, _ = _scan_csv(path)
+        fingerprint = _csv_memo[memo_key] = {"size": size, "sha256": digest}
+    return fingerprint
+
+def _version_key(payload: dict):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _source_key(fingerprint: dict):
+    return _version_key({"format": TABLE_FORMAT_VERSION, "csv": fingerprint})
+
+def source_version(csv_file: str):
+    """
+    Key of the cached (pre-blacklist) table: changes with the complete lines of csv_file
+    or TABLE_FORMAT_VERSION, so a row still being written does not invalidate it.
+    """
+    return _source_key(csv_fingerprint(csv_file))
+
+def table_version(csv_file: str, blacklist_path: str = None):
+    """
+    Short, stable key for the filtered table built from csv_file + blacklist_path.
+    Changes whenever either input (or TABLE_FORMAT_VERSION) changes.
+    """
+    return _version_key({
+        "format": TABLE_FORMAT_VERSION,
+        "csv": file_fingerprint(csv_file),
+        "blacklist": file_fingerprint(blacklist_path),
+    })
+
+# ----------------------------
+# Filtering (CSV -> submitted, de-tested, blacklisted table)
+# ----------------------------
+ID_COLUMNS = ["participant_id", "publication_id"]
+# read by nothing downstream: "Unnamed: 0" is a saved pandas index, status is constant after filtering
+DROPPED_COLUMNS = ["status"]
+
+@profiling.timed("datastore.read_csv")
+def read_submissions_csv(source):
+    """Reads a submissions export (path or buffer) without the saved pandas index column."""
+    return pd.read_csv(
+        source,
+        usecols=lambda c: not c.startswith("Unnamed:"),
+        dtype={"status": "category", "fullName": "category"},
+    )
+
+def compact_submissions(df: pd.DataFrame):
+    """
+    In-place: IDs become categoricals of normalized str (see blacklist.normalize_ids),
+    names categoricals and integer columns the narrowest int type. Idempotent, so it
+    also re-compacts tables concatenated from separately compacted parts.
+    """
+    for column in ID_COLUMNS:
+        df[column] = normalize_ids(df[column])
+    if "fullName" in df.columns:
+        df["fullName"] = df["fullName"].astype("category")
+    for column in df.select_dtypes("integer").columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+def prepare_submissions(df: pd.DataFrame):
+    """Submitted, non-test rows with IDs normalized to str categoricals; the blacklist is applied later."""
+    keep = (df["status"] == "submitted") & ~df["participant_id"].isin(TEST_PARTICIPANTS)
+    df_submitted = df.loc[keep.to_numpy(), [c for c in df.columns if c not in DROPPED_COLUMNS]]
+    df_submitted.index = pd.RangeIndex(len(df_submitted))  # relabel without another copy
+    return compact_submissions(df_submitted)
+
+# ----------------------------
+# Blob stores: random access to per-row payloads
+# ----------------------------
+BLOB_COLUMN = "merged_data"
+PROTOCOL_COLUMN = "protocol"
+SUMMARY_COLUMN = "summary"
+ERROR_COLUMN = "parse_error"
+
+class BlobStore:
+    """
+    merged_data blobs addressed by row label of the index table.
+    Backed either by a memory-mapped Arrow file (only the pages that are read become
+    resident) or, when no cache file is available, by an in-memory list.
+    """
+    column = BLOB_COLUMN
+
+    def __init__(self, path: str = None, values=None):
+        self.path = path
+        self._values = list(values) if values is not None else None
+        self._column = None
+
+    def __getstate__(self):
+        # st.cache_data pickles return values; never ship the mapped column around
+        state = self.__dict__.copy()
+        state["_column"] = None
+        return state
+
+    def _mapped(self):
+        if self._column is None:
+            import pyarrow.feather as feather
+            self._column = feather.read_table(self.path, memory_map=True).column(self.column)
+        return self._column
+
+    def _decode(self, value):
+        return value
+
+    def __len__(self):
+        if self._values is not None:
+            return len(self._values)
+        return len(self._mapped())
+
+    def get(self, row: int):
+        if self._values is not None:
+            return self._values[row]
+        return self._decode(self._mapped()[int(row)].as_py())
+
+    def take(self, rows):
+        rows = [int(r) for r in rows]
+        if self._values is not None:
+            return [self._values[r] for r in rows]
+        if not rows:
+            return []
+        return [self._decode(v) for v in self._mapped().take(rows).to_pylist()]
+
+class ProtocolStore(BlobStore):
+    """
+    Normalized protocols (see protocols.normalize_protocol) addressed like BlobStore.
+    On disk each row is a pickled dict, which loads far faster than re-decoding the blob.
+    """
+    column = PROTOCOL_COLUMN
+
+    @staticmethod
+    def encode(protocols):
+        return [None if p is None else pickle.dumps(p, protocol=pickle.HIGHEST_PROTOCOL) for p in protocols]
+
+    def _decode(self, value):
+        return None if value is None else pickle.loads(value)
+
+class SummaryStore(ProtocolStore):
+    """Display summaries (see protocols.summarize_protocol), step lengths included."""
+    column = SUMMARY_COLUMN
+
+class Submissions(NamedTuple):
+    df: pd.DataFrame            # index table: every column except merged_data, plus parse_error
+    blobs: BlobStore            # raw merged_data
+    protocols: ProtocolStore    # normalized merged_data
+    summaries: SummaryStore     # what the page displays per protocol
+    blacklist_report: list = None  # rows removed per blacklist rule (see blacklist.apply_blacklist)
+
+# ----------------------------
+# On-disk columnar cache (Feather / Arrow IPC, uncompressed so it can be memory-mapped)
+# ----------------------------
+CACHE_PREFIXES = ("submissions-", "blobs-", "protocols-", "summaries-")
+
+def _cache_paths(cache_dir: str, version: str):
+    return [os.path.join(cache_dir, f"{prefix}{version}.feather") for prefix in CACHE_PREFIXES]
+
+def _read_cached(index_path: str, blob_path: str, protocol_path: str, summary_path: str):
+    try:
+        import pyarrow.feather as feather
+        index_df = feather.read_table(index_path, memory_map=True).to_pandas()
+    except Exception:
+        return None
+    return Submissions(index_df, BlobStore(path=blob_path), ProtocolStore(path=protocol_path), SummaryStore(path=summary_path))
+
+def _prune_cache(cache_dir: str, paths: list, keep: int = settings.VERSIONS_KEPT):
+    """
+    Drops tables in cache_dir built from older inputs: every version but the one in paths
+    and the keep - 1 most recently written others, whose stores sessions still on them
+    memory-map lazily.
+    """
+    current = {os.path.basename(p) for p in paths}
+    written = {}  # older version -> its files and when it was last written
+    for name in os.listdir(cache_dir):
+        if name.startswith(CACHE_PREFIXES) and name.endswith(".feather") and name not in current:
+            version = name[name.index("-") + 1:-len(".feather")]
+            try:
+                mtime = os.stat(os.path.join(cache_dir, name)).st_mtime_ns
+            except OSError:
+                continue
+            names, newest = written.get(version, ([], 0))
+            written[version] = (names + [name], max(newest, mtime))
+    for version in sorted(written, key=lambda v: written[v][1], reverse=True)[keep - 1:]:
+        for name in written[version][0]:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+def _write_cached(index_df: pd.DataFrame, payloads: dict, cache_dir: str, paths: list, prune: bool = True):
+    """
+    payloads maps column name -> values (list or pyarrow Table) for blobs/protocols/summaries,
+    in CACHE_PREFIXES order.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # payloads first: the index file is the marker that every part is complete
+        for path, (column, values) in zip(paths[1:], payloads.items()):
+            write_feather_atomic(values if not isinstance(values, list) else pd.DataFrame({column: values}), path)
+        write_feather_atomic(index_df, paths[0])
+    except Exception:
+        return False
+    if prune:
+        _prune_cache(cache_dir, paths)
+    return True
+
+def _build_parts(df: pd.DataFrame, workers: int = None):
+    """Filters raw CSV rows (blacklist excluded) and normalizes them. Returns (index_df, blobs, normalized, summaries)."""
+    index_df = prepare_submissions(df)
+    blobs = index_df.pop(BLOB_COLUMN).tolist()
+
+    # normalize, summarize and size every step once, here, instead of per render
+    records = protocols.process_blobs(blobs, workers)
+    index_df[ERROR_COLUMN] = [r["error"] for r in records]
+    return index_df, blobs, [r["protocol"] for r in records], [r["summary"] for r in records]
+
+def _encoded_payloads(blobs: list, normalized: list, summaries: list):
+    return {
+        BLOB_COLUMN: blobs,
+        PROTOCOL_COLUMN: ProtocolStore.encode(normalized),
+        SUMMARY_COLUMN: SummaryStore.encode(summaries),
+    }
+
+# ----------------------------
+# Incremental ingest of appended CSV rows
+# ----------------------------
+MANIFEST_NAME = "manifest.json"
+# Appends are detected by file growth plus an unchanged header and unchanged bytes just
+# before the last ingested offset; in-place edits further back are not detected, so
+# exports that rewrite history should bump TABLE_FORMAT_VERSION or clear the cache.
+TAIL_CHECK_BYTES = 1 << 20
+
+def _tail_start(header_size: int, offset: int):
+    """Start of the bytes hashed to check that the first offset bytes are unchanged."""
+    return max(header_size, offset - TAIL_CHECK_BYTES)
+
+def _manifest(version: str, rows: int, header: bytes, data: bytes, data_start: int):
+    """
+    Manifest of the table at version, built from the CSV bytes [0, data_start + len(data)),
+    of which data are the last ones (at least the tail window).
+    """
+    offset = data_start + len(data)
+    tail = data[_tail_start(len(header), offset) - data_start:]
+    return {
+        "version": version,
+        "format": TABLE_FORMAT_VERSION,
+        "csv_header": header.decode("utf-8", errors="replace"),
+        "csv_offset": offset,
+        "tail_sha256": hashlib.sha256(tail).hexdigest(),
+        "rows": rows,
+    }
+
+def _read_manifest(cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(cache_dir: str, manifest: dict):
+    with atomic_write(os.path.join(cache_dir, MANIFEST_NAME), "w") as fh:
+        json.dump(manifest, fh)
+
+def _ingest_appended(csv_file: str, cache_dir: str):
+    """
+    If csv_file only grew (by appended rows) since the cached table was built, and its
+    header is unchanged, filters/normalizes just the complete new rows and writes the
+    merged table under the version of every byte ingested so far.
+    Returns (Submissions, manifest), or None when a full rebuild is needed.
+    """
+    manifest = _read_manifest(cache_dir)
+    if not manifest or manifest.get("format") != TABLE_FORMAT_VERSION:
+        return None
+    offset = manifest["csv_offset"]
+    data_start = _tail_start(len(manifest["csv_header"].encode("utf-8")), offset)
+    # one read: the bytes checked, parsed, hashed into the version and recorded as the new
+    # offset are the same, so rows appended meanwhile are simply left for the next load
+    header, size, digest, data = _scan_csv(csv_file, keep_from=data_start)
+    if size <= offset or header.decode("utf-8", errors="replace") != manifest["csv_header"]:
+        return None
+    if hashlib.sha256(data[:offset - data_start]).hexdigest() != manifest["tail_sha256"]:
+        return None
+    old_paths = _cache_paths(cache_dir, manifest["version"])
+    if not all(os.path.exists(p) for p in old_paths):
+        return None
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    new_rows = read_submissions_csv(io.BytesIO(header + data[offset - data_start:]))
+    index_new, blobs, normalized, summaries = _build_parts(new_rows)
+
+    old_index = feather.read_table(old_paths[0], memory_map=True).to_pandas()
+    index_df = compact_submissions(pd.concat([old_index, index_new], ignore_index=True))
+
+    payloads = {}
+    for old_path, (column, values) in zip(old_paths[1:], _encoded_payloads(blobs, normalized, summaries).items()):
+        old_table = feather.read_table(old_path, memory_map=True)
+        new_table = pa.table({column: pa.array(values, type=old_table.schema.field(column).type)})
+        payloads[column] = pa.concat_tables([old_table, new_table])
+
+    version = _source_key({"size": size, "sha256": digest})
+    paths = _cache_paths(cache_dir, version)
+    if not _write_cached(index_df, payloads, cache_dir, paths):
+        return None
+    submissions = Submissions(index_df, BlobStore(path=paths[1]), ProtocolStore(path=paths[2]), SummaryStore(path=paths[3]))
+    return submissions, _manifest(version, len(index_df), header, data, data_start)
+
+# ----------------------------
+# Loading
+# ----------------------------
+def _load_source(csv_file: str, cache_dir: str, incremental: bool):
+    """The normalized, not yet blacklisted table for csv_file (see load_submissions_index)."""
+    if cache_dir:
+        paths = _cache_paths(cache_dir, source_version(csv_file))
+        if all(os.path.exists(p) for p in paths):
+            cached = _read_cached(*paths)
+            if cached is not None:
+                profiling.count("datastore.table_cache.hit")
+                return cached
+        if incremental:
+            try:
+                merged = _ingest_appended(csv_file, cache_dir)
+            except Exception:
+                merged = None
+            if merged is not None:
+                profiling.count("datastore.table_cache.incremental")
+                _write_manifest(cache_dir, merged[1])
+                return merged[0]
+
+    profiling.count("datastore.table_cache.miss")
+    header, size, digest, data = _scan_csv(csv_file, keep_from=0)
+    index_df, blobs, normalized, summaries = _build_parts(read_submissions_csv(io.BytesIO(data)))
+
+    if cache_dir:
+        # keyed on the bytes parsed, which may be more than source_version saw above
+        version = _source_key({"size": size, "sha256": digest})
+        paths = _cache_paths(cache_dir, version)
+        if _write_cached(index_df, _encoded_payloads(blobs, normalized, summaries), cache_dir, paths):
+            _write_manifest(cache_dir, _manifest(version, len(index_df), header, data, 0))
+            return Submissions(index_df, BlobStore(path=paths[1]), ProtocolStore(path=paths[2]), SummaryStore(path=paths[3]))
+    return Submissions(index_df, BlobStore(values=blobs), ProtocolStore(values=normalized), SummaryStore(values=summaries))
+
+@profiling.timed("datastore.load_submissions_index")
+def load_submissions_index(csv_file: str, blacklist_path: str = None, cache_dir: str = CACHE_DIR, incremental: bool = True):
+    """
+    Two-tier load: returns Submissions(df, blobs, protocols, summaries, blacklist_report).
+    df holds every column except merged_data, plus parse_error (None, or why the row's
+    blob could not be normalized). Its index labels address the stores:
+    blobs/protocols/summaries .take(df.index[...]) fetch the raw, normalized and
+    display-ready merged_data for just the rows being rendered.
+
+    The normalized table is persisted next to the data, keyed on the fingerprint of
+    csv_file only, so later calls (including other processes) memory-map it instead of
+    re-parsing the CSV. Pass cache_dir=None to disable the on-disk cache.
+    With incremental=True, a CSV that only had rows appended is merged into the previous
+    table by processing just the new rows; header or format changes rebuild everything.
+    The blacklist is compiled once per workbook version and applied last as a vectorized
+    mask, so editing it never re-parses anything.
+    """
+    if blacklist_path is None:
+        blacklist_path = find_blacklist_path()
+
+    source = _load_source(csv_file, cache_dir, incremental)
+    df, report = apply_blacklist(source.df, compile_blacklist(blacklist_path, cache_dir))
+    return source._replace(df=df, blacklist_report=report)
+
+@profiling.timed("datastore.load_submissions_table")
+def load_submissions_table(csv_file: str, blacklist_path: str = None, cache_dir: str = CACHE_DIR):
+    """
+    Returns the filtered submissions table, merged_data included.
+    Prefer load_submissions_index when only a few rows' blobs are needed.
+    """
+    submissions = load_submissions_index(csv_file, blacklist_path, cache_dir)
+    columns = {c: submissions.df[c].array for c in submissions.df.columns if c != ERROR_COLUMN}
+    columns[BLOB_COLUMN] = submissions.blobs.take(submissions.df.index)
+    return pd.DataFrame(columns)
+
+# ----------------------------
+# Offline bundles (built by build_bundle.py, opened by the app at startup)
+# ----------------------------
+BUNDLE_DIR = settings.BUNDLE_DIR
+BUNDLE_MANIFEST = settings.BUNDLE_MANIFEST
+
+@profiling.timed("datastore.build_bundle")
+def build_bundle(csv_file: str, blacklist_path: str = None, bundle_dir: str = BUNDLE_DIR, workers: int = None):
+    """
+    Filters, blacklists and normalizes csv_file in one pass (process_blobs over workers
+    processes, default protocols.default_workers()) and writes the result to bundle_dir:
+    the index table and the blob / protocol / summary stores (step lengths and time labels
+    included) as Feather files named by table version, then bundle.json describing them.
+    Blacklisted rows are dropped from every file, so the stores hold only servable rows.
+    Returns (Submissions backed by the bundle files, manifest).
+    """
+    version = table_version(csv_file, blacklist_path)
+    index_df, blobs, normalized, summaries = _build_parts(read_submissions_csv(csv_file), workers)
+    index_df, report = apply_blacklist(index_df, compile_blacklist(blacklist_path))
+
+    rows = index_df.index.tolist()  # prepare_submissions labels rows 0..n-1, so labels are positions
+    index_df = index_df.reset_index(drop=True)
+    for column in index_df.select_dtypes("category").columns:
+        index_df[column] = index_df[column].cat.remove_unused_categories()
+    payloads = _encoded_payloads([blobs[r] for r in rows], [normalized[r] for r in rows], [summaries[r] for r in rows])
+
+    paths = _cache_paths(bundle_dir, version)
+    if not _write_cached(index_df, payloads, bundle_dir, paths, prune=False):
+        raise OSError(f"could not write the bundle to {bundle_dir}")
+    manifest = {
+        "version": version,
+        # cache key for indexes, fragments and analytics derived from the bundle: its rows are
+        # renumbered after the blacklist, so nothing is shared with the CSV-built table
+        "key": f"bundle-{version}",
+        "format": TABLE_FORMAT_VERSION,
+        "created": pd.Timestamp.now(tz="UTC").isoformat(timespec="seconds"),
+        "source": {
+            "csv": {"path": os.path.abspath(csv_file), **file_fingerprint(csv_file)},
+            "blacklist": None if not blacklist_path else {"path": os.path.abspath(blacklist_path), **(file_fingerprint(blacklist_path) or {})},
+        },
+        "rows": len(index_df),
+        "parse_errors": int(index_df[ERROR_COLUMN].notna().sum()),
+        "files": [os.path.basename(p) for p in paths],
+        "blacklist_report": report,
+    }
+    # the manifest goes last and older versions are removed only after it points at the new
+    # files, so an app starting mid-build still opens a complete (previous) bundle
+    with atomic_write(os.path.join(bundle_dir, BUNDLE_MANIFEST), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    _prune_cache(bundle_dir, paths)
+    return Submissions(index_df, BlobStore(path=paths[1]), ProtocolStore(path=paths[2]), SummaryStore(path=paths[3]), report), manifest
+
+def read_bundle_manifest(bundle_dir: str = BUNDLE_DIR):
+    """The manifest of the bundle in bundle_dir, or None when there is no usable bundle (missing, partial or older format)."""
+    try:
+        with open(os.path.join(bundle_dir, BUNDLE_MANIFEST)) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != TABLE_FORMAT_VERSION:
+        return None
+    if not all(os.path.exists(p) for p in _cache_paths(bundle_dir, manifest["version"])):
+        return None
+    return manifest
+
+@profiling.timed("datastore.open_bundle")
+def open_bundle(bundle_dir: str = BUNDLE_DIR, manifest: dict = None):
+    """
+    Submissions from the bundle in bundle_dir, memory-mapped as built (nothing is parsed,
+    filtered or normalized here), or None when there is no usable bundle.
+    """
+    manifest = manifest or read_bundle_manifest(bundle_dir)
+    if manifest is None:
+        return None
+    submissions = _read_cached(*_cache_paths(bundle_dir, manifest["version"]))
+    if submissions is None:
+        return None
+    return submissions._replace(blacklist_report=manifest.get("blacklist_report"))
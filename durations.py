@@ -0,0 +1,121 @@
+import re
+import numpy as np
+import pandas as pd
+
+import profiling
+
+# Steps shorter than this (or without a usable duration) are drawn at this length
+MIN_STEP_HOURS = 35
+
+HOURS_PER_UNIT = {"week": 7 * 24, "day": 24}
+
+# ----------------------------
+# Precompiled patterns
+# ----------------------------
+NUMBER_WORDS = {
+    "one": "1","two": "2","three": "3","four": "4","five": "5","six": "6",
+    "seven": "7","eight": "8","nine": "9","ten": "10","eleven": "11","twelve": "12",
+}
+# whole whitespace-separated tokens only, like str.split() would see them
+NUMBER_WORD_RE = re.compile(r"(?<!\S)(" + "|".join(NUMBER_WORDS) + r")(?!\S)", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+RANGE_RE = re.compile(r"(\d+)-(\d+)")
+INT_RE = re.compile(r"(\d+)")
+NUMBER_RE = re.compile(r"(\d+\.\d+|\d+)")
+PAREN_HOURS_RE = re.compile(r"\((\d+)h\)")
+
+def _number_word(match):
+    return NUMBER_WORDS[match.group(1).lower()]
+
+def _range_replacer(unit: str):
+    def replace_with_duration(match):
+        difference = int(match.group(2)) - int(match.group(1)) + 1
+        return f"{difference} {unit}{'s' if difference > 1 else ''}"
+    return replace_with_duration
+
+# ----------------------------
+# Vectorized normalization
+# ----------------------------
+def _mean_of_matches(s: pd.Series, pattern, factor: float = 1.0):
+    """Per-row mean of every number pattern matches in s, times factor (NaN where nothing matches), and the match counts."""
+    found = s.str.findall(pattern)
+    counts = found.str.len()
+    numbers = found.explode().dropna()
+    means = pd.Series(np.nan, index=s.index)
+    if len(numbers):
+        # plain left-to-right sums (like np.mean on a short list), grouped by row
+        values = numbers.to_numpy(dtype=float) * factor
+        rows, starts = np.unique(numbers.index.to_numpy(), return_index=True)
+        means[rows] = np.add.reduceat(values, starts) / counts[rows].to_numpy()
+    return means, counts
+
+@profiling.timed("durations.normalize_durations")
+def normalize_durations(duration_hours: pd.Series, min_hours: float = MIN_STEP_HOURS):
+    """
+    Normalizes a Series of durationHours strings in one pass.
+    Returns (hours, labels): a float ndarray of step lengths in hours (at least
+    min_hours) and an object ndarray of timeline labels ("72\\nhours", "Not specified").
+    With min_hours=None, hours are as parsed and NaN where no duration is given.
+
+    Rules: "N weeks"/"N days" (several numbers are averaged) become hours;
+    "day 3-5"-style ranges become their length in that unit; plain numbers are hours,
+    averaged when there are two, or taken from "(Nh)" when there are more.
+    """
+    raw = pd.Series(duration_hours, dtype=object)
+    raw = raw.where(raw.notna(), "").astype(str)
+
+    # exports repeat the same few hundred strings; normalize each distinct one once
+    codes, uniques = pd.factorize(raw)
+    s = pd.Series(uniques, dtype=object)
+
+    # number words -> digits, whitespace collapsed
+    s = s.str.replace(NUMBER_WORD_RE, _number_word, regex=True)
+    s = s.str.replace(WHITESPACE_RE, " ", regex=True).str.strip()
+
+    # "Day 3-5" -> "3 days"
+    is_range = s.str.contains("-", regex=False) & s.str[:1].str.isalpha()
+    if is_range.any():
+        lowered = s[is_range].str.lower()
+        unit = np.select(
+            [lowered.str.contains("day"), lowered.str.contains("week"), lowered.str.contains("hour")],
+            ["day", "week", "hour"],
+            default="",
+        )
+        for u in np.unique(unit):
+            rows = lowered.index[unit == u]
+            s.loc[rows] = lowered.loc[rows].str.replace(RANGE_RE, _range_replacer(u), regex=True)
+
+    lowered = s.str.lower()
+    is_week = lowered.str.contains("week", regex=False)
+    is_day = ~is_week & lowered.str.contains("day", regex=False)
+    is_plain = ~is_week & ~is_day
+
+    hours = pd.Series(np.nan, index=s.index)
+    labels = pd.Series("", index=s.index, dtype=object)
+
+    # weeks / days: average of every integer, converted to hours
+    for mask, unit in ((is_week, "week"), (is_day, "day")):
+        if mask.any():
+            hours[mask] = _mean_of_matches(s[mask], INT_RE, HOURS_PER_UNIT[unit])[0]
+    unit_rows = (is_week | is_day) & hours.notna()
+    labels[unit_rows] = hours[unit_rows].astype(int).astype(str) + " hours"
+
+    # plain numbers: hours as written
+    num_means, num_counts = _mean_of_matches(s, NUMBER_RE)
+    plain = is_plain & (num_counts > 0) & (s != "0")
+    hours[plain] = num_means[plain]
+    use_parens = plain & (num_counts > 2) & s.str.contains("(", regex=False)
+    if use_parens.any():
+        hours[use_parens] = s[use_parens].str.extract(PAREN_HOURS_RE)[0].astype(float)
+    labels[plain] = s[plain]
+
+    # labels: hours on their own line; unknown durations get the minimum width
+    missing = hours.isna()
+    has_hours = labels.str.lower().str.contains("hours", regex=False)
+    labels[~missing & has_hours] = labels[~missing & has_hours].str.replace(" hours", "\nhours", regex=False)
+    labels[~missing & ~has_hours] = labels[~missing & ~has_hours] + "\nhours"
+    labels[missing] = "Not specified"
+    if min_hours is not None:
+        hours = hours.fillna(min_hours).clip(lower=min_hours)
+
+    return hours.to_numpy(dtype=float)[codes], labels.to_numpy(dtype=object)[codes]
@@ -0,0 +1,246 @@
+# Streaming bulk export of normalized protocols: JSONL, CSV, Parquet or a zip of
+# rendered HTML, for any PMID / participant filter, blacklist applied or not.
+# Every format is a generator of byte chunks fed CHUNK_ROWS rows at a time, so memory
+# stays flat however large the export is.
+#
+#   python export.py --format jsonl > protocols.jsonl
+#   python export.py --format csv --pmid 19287398 --pmid 21151107 -o steps.csv
+#   python export.py --format parquet --no-blacklist -o all.parquet
+#   python export.py --format html --participant 268126429382705153 -o protocols.zip
+import io
+import sys
+import csv
+import json
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+
+import render
+import datastore
+import settings
+import durations
+import profiling
+
+CHUNK_ROWS = 256
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    "jsonl": ("jsonl", "application/x-ndjson"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "html": ("zip", "application/zip"),
+}
+
+# Flat formats (CSV, Parquet) have one row per protocol step; submissions without a
+# drawable protocol get a single row with step empty and parse_error set
+ID_FIELDS = ["publication_id", "participant_id", "fullName", "assignment_id", "parse_error"]
+STEP_FIELDS = [
+    "cell_lines", "targets", "step", "duration", "hours", "time_label",
+    "media", "supplements", "growth_factors", "matrix", "markers",
+]
+
+# ----------------------------
+# Sources and filters
+# ----------------------------
+def open_source(csv_file: str, blacklist: bool = True, cache_dir: str = datastore.CACHE_DIR):
+    """
+    Submissions to export from: the app's table (blacklist applied), or every submitted,
+    non-test row with blacklist=False. Both come from the same on-disk table cache.
+    """
+    return datastore.load_submissions_index(csv_file, None if blacklist else "", cache_dir)
+
+def select_rows(df: pd.DataFrame, pmids=None, participants=None):
+    """Row positions of df matching any of pmids and any of participants (None or empty = no filter)."""
+    keep = np.ones(len(df), dtype=bool)
+    if pmids:
+        keep &= df["publication_id"].isin([str(p).strip() for p in pmids]).to_numpy()
+    if participants:
+        keep &= df["participant_id"].isin([str(p).strip() for p in participants]).to_numpy()
+    return np.flatnonzero(keep)
+
+# ----------------------------
+# Record pipeline
+# ----------------------------
+def iter_chunks(submissions, rows, chunk_rows: int = CHUNK_ROWS):
+    """
+    Yields lists of records for rows (positions in submissions.df), chunk_rows at a time:
+    {ID_FIELDS..., "row", "protocol", "summary"}, with each summary step's "hours" set to
+    the parsed duration (None when not given, unlike the drawn "length").
+    """
+    df = submissions.df
+    rows = np.asarray(rows, dtype=np.intp)
+    fields = [c for c in ID_FIELDS if c in df.columns]
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        labels = df.index[chunk]
+        meta = df.iloc[chunk][fields].astype(object).to_dict("records")
+        protocols = submissions.protocols.take(labels)
+        summaries = submissions.summaries.take(labels)
+
+        steps = [step for summary in summaries if summary for step in summary["steps"]]
+        if steps:
+            hours, _ = durations.normalize_durations(pd.Series([s["duration"] for s in steps], dtype=object), min_hours=None)
+            for step, h in zip(steps, hours.tolist()):
+                step["hours"] = None if np.isnan(h) else h
+
+        yield [
+            {**entry, "row": int(row), "protocol": protocol, "summary": summary}
+            for row, entry, protocol, summary in zip(chunk, meta, protocols, summaries)
+        ]
+
+def step_rows(record: dict):
+    """The flat CSV / Parquet rows of one record."""
+    ids = {name: record.get(name) for name in ID_FIELDS}
+    summary = record["summary"]
+    if not summary:
+        return [{**ids, **{name: None for name in STEP_FIELDS}}]
+    return [
+        {
+            **ids,
+            "cell_lines": summary["cell_lines"],
+            "targets": summary["targets"],
+            "step": str(step["key"]),
+            "duration": step["duration"],
+            "hours": step.get("hours"),
+            "time_label": (step["time_label"] or "").replace("\n", " "),
+            **{name: step[name] for name in ("media", "supplements", "growth_factors", "matrix", "markers")},
+        }
+        for step in summary["steps"]
+    ]
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that hands out what was written since the last drain()."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+# ----------------------------
+# Formats (generators of bytes)
+# ----------------------------
+def iter_jsonl(chunks):
+    """One JSON object per submission: IDs, parse_error, summary fields and the normalized protocol."""
+    for records in chunks:
+        lines = []
+        for record in records:
+            summary = record["summary"] or {}
+            out = {name: record.get(name) for name in ID_FIELDS}
+            out.update(
+                cell_lines=summary.get("cell_lines"),
+                targets=summary.get("targets"),
+                steps=summary.get("steps"),
+                protocol=record["protocol"],
+            )
+            lines.append(json.dumps(out, ensure_ascii=False, default=str))
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def iter_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ID_FIELDS + STEP_FIELDS)
+    writer.writeheader()
+    for records in chunks:
+        writer.writerows(row for record in records for row in step_rows(record))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def iter_parquet(chunks):
+    """One Parquet row group per chunk, so only one chunk of rows is ever in memory."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(name, pa.int64() if name == "assignment_id" else pa.string()) for name in ID_FIELDS]
+        + [(name, pa.float64() if name == "hours" else pa.string()) for name in STEP_FIELDS]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for records in chunks:
+            rows = [row for record in records for row in step_rows(record)]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+def protocol_document(layout: render.ProtocolLayout):
+    """A standalone HTML page for one laid-out protocol (render.CSS inlined)."""
+    body = layout.html if layout.drawable else f"<p>{layout.warning or 'No protocol submitted.'}</p>"
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'>{render.CSS}</head><body>{body}</body></html>"
+
+def iter_html_zip(chunks, toggles: render.Toggles = render.Toggles()):
+    """A zip of one rendered page per submission, named <PMID>/<participant>-<row>.html."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for records in chunks:
+            for record in records:
+                layout = render.layout_protocol(
+                    record["publication_id"], record["participant_id"], record["summary"], toggles, record.get("parse_error")
+                )
+                archive.writestr(f"{record['publication_id']}/{record['participant_id']}-{record['row']}.html", protocol_document(layout))
+            yield sink.drain()
+    yield sink.drain()
+
+WRITERS = {"jsonl": iter_jsonl, "csv": iter_csv, "parquet": iter_parquet, "html": iter_html_zip}
+
+@profiling.timed("export.stream_export")
+def stream_export(submissions, fmt: str, pmids=None, participants=None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Generator of the bytes of an export of submissions (datastore.Submissions) in fmt
+    (see FORMATS), restricted to pmids / participants. Nothing is read before the first
+    chunk is requested, and at most chunk_rows protocols are held at a time.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    rows = select_rows(submissions.df, pmids, participants)
+    for data in WRITERS[fmt](iter_chunks(submissions, rows, chunk_rows)):
+        if data:
+            yield data
+
+def export_to(fh, submissions, fmt: str, pmids=None, participants=None):
+    """Streams an export into the binary file object fh; returns the number of bytes written."""
+    written = 0
+    for data in stream_export(submissions, fmt, pmids, participants):
+        fh.write(data)
+        written += len(data)
+    return written
+
+def export_filename(fmt: str, stem: str = "protocols"):
+    return f"{stem}.{FORMATS[fmt][0]}"
+
+# ----------------------------
+# Command line
+# ----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream normalized protocols to JSONL, CSV, Parquet or a zip of HTML.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="jsonl")
+    parser.add_argument("--csv", default=settings.CSV_FILE, help=f"submissions export (default: {settings.CSV_FILE})")
+    parser.add_argument("--pmid", action="append", help="only these PMIDs (repeatable)")
+    parser.add_argument("--participant", action="append", help="only these participant IDs (repeatable)")
+    parser.add_argument("--no-blacklist", action="store_true", help="include rows the blacklist removes")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    submissions = open_source(args.csv, blacklist=not args.no_blacklist)
+    if args.output:
+        with open(args.output, "wb") as fh:
+            written = export_to(fh, submissions, args.format, args.pmid, args.participant)
+        print(f"{written} bytes written to {args.output}", file=sys.stderr)
+    else:
+        export_to(sys.stdout.buffer, submissions, args.format, args.pmid, args.participant)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+# Atomic file writes shared by every on-disk cache (tables, manifests, compiled blacklist,
+# selector lists, analytics). Readers in other threads, processes or replicas see either
+# the previous file or the complete new one, never a partial write.
+# Imports nothing heavy: selection.py uses it before pandas is loaded.
+import os
+import tempfile
+from contextlib import contextmanager
+
+# mkstemp creates 0600 files; cache files get the permissions open() would have given them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb"):
+    """
+    Yields a file object opened with mode on a unique temporary file next to path, which
+    replaces path when the block exits cleanly and is removed if it raises.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode) as fh:
+            yield fh
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_feather_atomic(df, path: str):
+    """Writes df (DataFrame or pyarrow Table) to path as uncompressed Feather, so it can be memory-mapped."""
+    import pyarrow.feather as feather
+    with atomic_write(path) as fh:
+        feather.write_feather(df, fh, compression="uncompressed")
@@ -1,565 +1,454 @@
 import os
-import re
+import html
 import json
-import numpy as np
-import pandas as pd
+import time
+import uuid
+import atexit
+import shutil
+import tempfile
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 
-st.set_page_config(layout="wide")
-st.title("Differentiation protocols")
-
-# ----------------------------
-# CSS
-# ----------------------------
-st.markdown(
-    """
-    <style>
-    .step-container-culturing {
-        padding: 10px;
-        border-radius: 10px;
-        background-color: #FFD9AD;
-        margin-bottom: 20px;
-        color: black;
-    }
-    .step-container {
-        padding: 10px;
-        border-radius: 10px;
-        background-color:  #DFE5FF;
-        margin-bottom: 20px;
-        color: black;
-    }
-    .readout-container {
-        padding: 10px;
-        border-radius: 10px;
-        background-color: #EAFFE4;
-        margin-bottom: 20px;
-        color: black;
-    }
-    .participant-container {
-        padding: 5px;
-        border-radius: 10px;
-        background-color: #FFFFF;
-        margin-bottom: 5px;
-    }
-    .participant-title {
-        font-size: 20px;
-        font-weight: bold;
-        text-align: center;
-    }
-    .custom-divider {
-        border: none;
-        height: 20px;
-        background-color: #001158;
-        margin: 0px 0;
-    }
-    .cell-box {
-        border-radius: 10px;
-        padding: 10px;
-        background-color: #FAE8F1;
-        text-align: center;
-        margin: 10px;
-    }
-    .arrow-box {
-        text-align: center;
-        display: flex;
-        font-size: 60px;
-        margin: 0 auto;
-        line-height: 1;
-        align-items: center;
-        justify-content: center;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
-# ----------------------------
-# Helpers (unchanged behavior, but used lazily)
-# ----------------------------
-def extract_number_in_parentheses(input_string: str):
-    match = re.search(r"\((\d+)h\)", input_string or "")
-    return match.group(1) if match else None
-
-def process_string(s: str):
-    return re.sub(r"\s+", " ", s or "").strip()
-
-def convert_number_words_to_digits(input_string: str):
-    number_words = {
-        "one": "1","two": "2","three": "3","four": "4","five": "5","six": "6",
-        "seven": "7","eight": "8","nine": "9","ten": "10","eleven": "11","twelve": "12",
-    }
-    if input_string is None:
-        return ""
-    words = str(input_string).split()
-    return " ".join([number_words.get(w.lower(), w) for w in words])
-
-def is_empty_or_null(item):
-    if isinstance(item, dict):
-        return all(is_empty_or_null(v) for v in item.values())
-    if isinstance(item, list):
-        return all(is_empty_or_null(v) for v in item)
-    return item in [None, "", False]
-
-def convert_to_duration_fixed(string: str):
-    pattern = re.compile(r"(\d+)-(\d+)")
-    def replace_with_duration(match):
-        num1 = int(match.group(1))
-        num2 = int(match.group(2))
-        difference = num2 - num1 + 1
-        if "day" in (string or "").lower():
-            unit = "day"
-        elif "week" in (string or "").lower():
-            unit = "week"
-        elif "hour" in (string or "").lower():
-            unit = "hour"
-        else:
-            unit = ""
-        return f"{difference} {unit}{'s' if difference > 1 else ''}"
-    return pattern.sub(replace_with_duration, string or "")
-
-def _safe_str(x):
-    if pd.isna(x):
-        return None
-    try:
-        if isinstance(x, (int, np.integer)):
-            return str(int(x))
-        if isinstance(x, float) and x.is_integer():
-            return str(int(x))
-    except Exception:
-        pass
-    return str(x).strip()
-
-def load_blacklists(excel_path: str):
-    remove_all_participants = set()
-    remove_pairs = set()      # (participant_id_str, pmid_str)
-    remove_pmids_full = set() # pmid_str
-
-    if not excel_path or not os.path.exists(excel_path):
-        return remove_all_participants, remove_pairs, remove_pmids_full
-
-    # Sheet1: participant_id + submissionsToRemove (PMIDs or 'all')
-    try:
-        sheet1 = pd.read_excel(excel_path, sheet_name="Sheet1")
-        if "participant_id" in sheet1.columns and "submissionsToRemove" in sheet1.columns:
-            for _, r in sheet1[["participant_id", "submissionsToRemove"]].iterrows():
-                pid = _safe_str(r["participant_id"])
-                subs = _safe_str(r["submissionsToRemove"])
-                if not pid or not subs:
-                    continue
-                if subs.lower() == "all":
-                    remove_all_participants.add(pid)
-                else:
-                    pmids = re.findall(r"\d+", subs)
-                    for p in pmids:
-                        remove_pairs.add((pid, p))
-    except Exception:
-        pass
-
-    # Sheet2: PMIDs to remove fully (first column)
-    try:
-        sheet2 = pd.read_excel(excel_path, sheet_name="Sheet2", header=None)
-        for v in sheet2.iloc[:, 0].dropna().tolist():
-            pmid = _safe_str(v)
-            if pmid and re.fullmatch(r"\d+", pmid):
-                remove_pmids_full.add(pmid)
-    except Exception:
-        pass
-
-    return remove_all_participants, remove_pairs, remove_pmids_full
-
-def find_blacklist_path():
-    candidates = [
-        "participant_blacklist.xlsx",
-        os.path.join("data", "participant_blacklist.xlsx"),
-    ]
-    return next((p for p in candidates if os.path.exists(p)), None)
-
-# ----------------------------
-# Load base table fast (NO merged_data parsing here)
-# ----------------------------
-@st.cache_data(show_spinner=True)
-def load_submissions_table(csv_file: str):
-    df = pd.read_csv(csv_file)
-
-    # submitted only
-    df_submitted = df[df["status"] == "submitted"].reset_index(drop=True)
-
-    # remove known test submissions
-    df_submitted = df_submitted[df_submitted["participant_id"] != 1246060743644676199]
-    df_submitted = df_submitted[df_submitted["participant_id"] != 753972611481993256]
-    df_submitted = df_submitted[df_submitted["participant_id"] != 204295234522185728]
-
-    # normalize IDs
-    df_submitted["participant_id"] = df_submitted["participant_id"].apply(_safe_str)
-    df_submitted["publication_id"] = df_submitted["publication_id"].apply(_safe_str)
-
-    # apply blacklists (fast)
-    bl_path = find_blacklist_path()
-    remove_all_participants, remove_pairs, remove_pmids_full = load_blacklists(bl_path)
+# Only light modules before the selectors are drawn; pandas / pyarrow come in with the
+# table (see "Data load" below), so a fresh replica shows its first widgets sooner.
+from appdata import CSV_FILE, load_selectors, load_submissions_index, load_reagent_index
+from selection import SHOW_ALL, SelectorLists, page_count
+from render_cache import LRUCache
+from prefetch import Prefetcher, neighbours
+import render
+import profiling
+from render import Toggles
 
-    if remove_pmids_full:
-        df_submitted = df_submitted[~df_submitted["publication_id"].isin(remove_pmids_full)]
-    if remove_all_participants:
-        df_submitted = df_submitted[~df_submitted["participant_id"].isin(remove_all_participants)]
-    if remove_pairs:
-        remove_keys = set([f"{pid}||{pmid}" for pid, pmid in remove_pairs])
-        keys = df_submitted["participant_id"].astype(str) + "||" + df_submitted["publication_id"].astype(str)
-        df_submitted = df_submitted[~keys.isin(remove_keys)]
-
-    return df_submitted.reset_index(drop=True)
-
-# ----------------------------
-# Parse & normalize ONE merged_data blob (lazy)
-# ----------------------------
-def parse_and_normalize_protocol(merged_raw):
-    """
-    Returns dictentry (dict) or None.
-    This is the expensive part, so we only do it for the rows the user wants to see.
-    """
-    try:
-        if merged_raw is None:
-            return None
-        if isinstance(merged_raw, float) and pd.isna(merged_raw):
-            return None
-        if isinstance(merged_raw, (bytes, bytearray)):
-            merged_raw = merged_raw.decode("utf-8", errors="replace")
-        if isinstance(merged_raw, str):
-            if merged_raw.strip() == "":
-                return None
-            dictentry = json.loads(merged_raw)
-        elif isinstance(merged_raw, dict):
-            dictentry = merged_raw
+st.set_page_config(layout="wide")
+# opt-in timings for this rerun: ?debug=1 in the URL, or EXTRACTOR_PROFILE=1 for every run
+profile_run = profiling.start_run("mainapp", enabled=profiling.requested(st.query_params))
+try:
+    st.title("Differentiation protocols")
+
+    EXPORT_WORKERS = int(os.environ.get("EXTRACTOR_EXPORT_WORKERS", "1"))
+    EXPORT_TTL = int(os.environ.get("EXTRACTOR_EXPORT_TTL", "3600"))  # seconds a prepared export stays downloadable
+    EXPORT_LABELS = {"jsonl": "JSON lines", "csv": "CSV (one row per step)", "parquet": "Parquet (one row per step)", "html": "Zip of HTML pages"}
+
+    # "html": each protocol is one HTML fragment (one element, flexbox timeline);
+    # "columns": st.columns / st.markdown per cell, as the page was originally drawn
+    RENDER_MODE = os.environ.get("EXTRACTOR_RENDER_MODE", "html")
+
+    PAGE_SIZES = [5, 10, 25, 50]
+    DEFAULT_PAGE_SIZE = int(os.environ.get("EXTRACTOR_PAGE_SIZE", "10"))
+    if DEFAULT_PAGE_SIZE not in PAGE_SIZES:
+        PAGE_SIZES = sorted(PAGE_SIZES + [DEFAULT_PAGE_SIZE])
+
+    csv_file = CSV_FILE
+    report_slot = st.container()  # blacklist report, filled in once the table is loaded
+
+    # ----------------------------
+    # UI selection
+    # ----------------------------
+    # from the small selector index saved with the table when there is one, so the selectors
+    # show before the table is opened; otherwise (first start on new data) the table first
+    with profiling.span("appdata.load_selectors"):
+        selectors = load_selectors(csv_file)
+    if selectors is None:
+        submissions, selectors, table_version = load_submissions_index(csv_file)
+
+    protocol_options = st.columns(2)
+    pmids = selectors.pmids
+
+    with protocol_options[0]:
+        selected_pmid = st.selectbox("Select a PMID", pmids + [SHOW_ALL])
+
+    participants = selectors.participants_for(selected_pmid)
+
+    with protocol_options[1]:
+        selected_participants = st.selectbox("Select a Participant ID", [SHOW_ALL] + participants)
+
+    st.write("Plotting parameters:")
+    checks = st.columns(6)
+    with checks[1]:
+        mediacheckbox = st.checkbox("Show media", value=True)
+    with checks[2]:
+        supplementscheckbox = st.checkbox("Show supplements", value=True)
+    with checks[3]:
+        gfcheckbox = st.checkbox("Show growth factors", value=True)
+    with checks[4]:
+        matrixcheckbox = st.checkbox("Show culture matrix", value=True)
+    with checks[5]:
+        markerscheckbox = st.checkbox("Show readout", value=True)
+    with checks[0]:
+        cellcheckbox = st.checkbox("Show cell lines and targets", value=True)
+    toggles = Toggles(cellcheckbox, mediacheckbox, supplementscheckbox, gfcheckbox, matrixcheckbox, markerscheckbox)
+
+    # ----------------------------
+    # CSS (after the first widgets: nothing above needs it)
+    # ----------------------------
+    st.markdown(render.CSS, unsafe_allow_html=True)
+    st.markdown(render.DIVIDER_HTML, unsafe_allow_html=True)
+
+    # ----------------------------
+    # Data load (memory-mapped table; the reagent index is built on the first search)
+    # ----------------------------
+    # imported here, not at the top: these pull in pandas, which the selectors above do not need
+    import compare
+    import export
+    from search import parse_query
+
+    submissions, selection_index, table_version = load_submissions_index(csv_file)
+    df_submitted, summary_store = submissions.df, submissions.summaries
+    if selectors is not selection_index and selectors != SelectorLists.from_index(selection_index):
+        st.rerun()  # the saved selector index was out of date; it has just been rewritten
+
+    if submissions.blacklist_report:
+        with report_slot.expander("Blacklist report"):
+            st.dataframe(submissions.blacklist_report, hide_index=True, use_container_width=True)
+
+    # Optional: don't do any heavy work until user clicks
+    actions = st.columns([1, 3])
+    with actions[0]:
+        run = st.button("Load / Render selection", type="primary")
+    with actions[1]:
+        compare_mode = st.toggle(
+            "Compare participants side by side",
+            disabled=selected_pmid == SHOW_ALL or len(participants) < 2,
+            help="For one PMID and all of its participants: align the annotators' steps and highlight differences.",
+        )
+    # a disabled toggle keeps its value: Compare only applies while it could be switched on
+    compare_active = compare_mode and selected_pmid != SHOW_ALL and len(participants) >= 2
+    if run:
+        # remembered so paging (which reruns the script) keeps showing this selection
+        st.session_state["rendered_selection"] = (selected_pmid, selected_participants)
+        st.session_state["page"] = 1
+
+    # ----------------------------
+    # Reagent / marker search
+    # ----------------------------
+    with st.form("search", border=False):
+        search_columns = st.columns([6, 1])
+        with search_columns[0]:
+            query = st.text_input(
+                "Search reagents, markers and cell lines",
+                placeholder="e.g. CHIR99021 & NKX2-5 upregulated  |  gf: BMP4 & target: cardiomyocyte",
+                help=(
+                    'Clauses joined by "&" must all match. Prefix a clause with media:, supplement:, gf:, '
+                    'matrix:, marker:, cell: or target: to search one field; end a marker with up/down '
+                    '(or ↑/↓) for its direction; quote a name for an exact match.'
+                ),
+            )
+        with search_columns[1]:
+            st.write("")
+            searched = st.form_submit_button("Search")
+    if searched and query.strip():
+        st.session_state["rendered_selection"] = ("search", query.strip())
+        st.session_state["page"] = 1
+
+    # ----------------------------
+    # Bulk export
+    # ----------------------------
+    # Exports stream to a temporary file on a shared, bounded pool, so a large export neither
+    # holds this session's script run nor anyone else's; the page polls until it is ready.
+    # The files live in one directory per process, swept by age and removed at exit, so
+    # downloaded or abandoned exports do not pile up.
+    @st.cache_resource
+    def get_export_pool():
+        return ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+    @st.cache_resource
+    def get_export_dir():
+        path = tempfile.mkdtemp(prefix="extractor-exports-")
+        atexit.register(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+    def sweep_exports(max_age: float = EXPORT_TTL):
+        """Removes exports not written to for max_age seconds."""
+        cutoff = time.time() - max_age
+        for entry in os.scandir(get_export_dir()):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def write_export(source, fmt, pmids, participants, path):
+        with open(path, "wb") as fh:
+            return export.export_to(fh, source() if callable(source) else source, fmt, pmids, participants)
+
+    def start_export(fmt, pmids, participants, include_blacklisted):
+        previous = st.session_state.pop("export_job", None)
+        if previous is not None:
+            previous["future"].cancel()
+            # removed now if it is finished or never started, else as soon as it finishes
+            previous["future"].add_done_callback(lambda _, path=previous["path"]: os.path.exists(path) and os.remove(path))
+        # blacklisted rows are not in the app's table; they come from the same cached source table
+        source = functools.partial(export.open_source, csv_file, blacklist=False) if include_blacklisted else submissions
+        sweep_exports()
+        fd, path = tempfile.mkstemp(prefix="export-", suffix="." + export.FORMATS[fmt][0], dir=get_export_dir())
+        os.close(fd)
+        st.session_state["export_job"] = {
+            "future": get_export_pool().submit(write_export, source, fmt, pmids, participants, path),
+            "path": path,
+            "file_name": export.export_filename(fmt),
+            "mime": export.FORMATS[fmt][1],
+        }
+
+    def export_status(polling: bool):
+        """Run as a fragment that re-runs every second while the export is being written."""
+        job = st.session_state.get("export_job")
+        if job is None:
+            return
+        future = job["future"]
+        if not future.done():
+            st.caption("Preparing export...")
+        elif future.cancelled():
+            st.caption("Export cancelled.")
+        elif future.exception() is not None:
+            st.error(f"Export failed: {future.exception()}")
+        elif polling:
+            st.rerun()  # finished since the page was drawn: redraw it once to stop polling
         else:
-            return None
-
-        if not isinstance(dictentry, dict):
-            return None
-
-        # REMOVE EMPTY KEYS (keeping 0, 1001, -1)
-        keys_to_retain = {"0", "1001", "-1"}
-        keys_to_remove = []
-        for key, value in dictentry.items():
-            if key in keys_to_retain:
-                continue
             try:
-                inner_dict = json.loads(value) if isinstance(value, str) else value
-            except Exception:
-                # if inner json is broken, treat as non-empty to avoid deleting
-                continue
-            if is_empty_or_null(inner_dict):
-                keys_to_remove.append(key)
-        for key in keys_to_remove:
-            dictentry.pop(key, None)
-
-        # step count calc as in your original logic
-        newstepcount = len(dictentry) - 1 - 1 - 1
-
-        # rename keys for consistency with downstream code
-        if "1000" in dictentry:
-            dictentry[str(newstepcount)] = dictentry.pop("1000")
-        if "1001" in dictentry:
-            dictentry["sequencingData"] = dictentry.pop("1001")
-        if "-1" in dictentry:
-            dictentry["cellLine"] = dictentry.pop("-1")
-
-        return dictentry
-    except Exception:
-        return None
-
-# ----------------------------
-# Data load (fast now)
-# ----------------------------
-csv_file = "data/submissions.csv"
-df_submitted = load_submissions_table(csv_file)
+                with open(job["path"], "rb") as fh:
+                    st.download_button(f"Download {job['file_name']} ({future.result() / 1024:,.0f} KB)", fh, file_name=job["file_name"], mime=job["mime"])
+            except FileNotFoundError:
+                st.caption("Export expired; prepare it again.")  # swept (see sweep_exports)
+
+    with st.expander("Export protocols"):
+        with st.form("export", border=False):
+            export_columns = st.columns([3, 3, 2])
+            with export_columns[0]:
+                export_pmids = st.multiselect("PMIDs", pmids, placeholder="All PMIDs")
+            with export_columns[1]:
+                export_participants = st.multiselect("Participant IDs", selection_index.participants, placeholder="All participants")
+            with export_columns[2]:
+                export_format = st.selectbox("Format", list(export.FORMATS), format_func=EXPORT_LABELS.get)
+            include_blacklisted = st.checkbox(
+                "Include blacklisted submissions",
+                disabled=not os.path.exists(csv_file),
+                help="Export every submitted protocol, including the rows the blacklist hides from this page.",
+            )
+            if st.form_submit_button("Prepare export"):
+                start_export(export_format, export_pmids, export_participants, include_blacklisted)
+        st.caption("For very large exports, `python export.py` streams the same formats straight to a file.")
+        export_job = st.session_state.get("export_job")
+        polling = export_job is not None and not export_job["future"].done()
+        st.fragment(export_status, run_every=1.0 if polling else None)(polling)
+
+    # Shared across sessions; keyed on (table version, row position, display toggles)
+    @st.cache_resource
+    def get_fragment_cache():
+        return LRUCache()
+
+    fragment_cache = get_fragment_cache()
+
+    # Shared across sessions; keyed on (table version, PMID)
+    @st.cache_resource
+    def get_comparison_cache():
+        return LRUCache()
+
+    comparison_cache = get_comparison_cache()
+
+    # Shared background pool warming the two caches above; one batch in flight per session
+    @st.cache_resource
+    def get_prefetcher():
+        return Prefetcher()
+
+    prefetcher = get_prefetcher()
+    prefetch_session = st.session_state.setdefault("prefetch_session", uuid.uuid4().hex)
+    # what was queued for another selection is of no use now: stop it before this run renders
+    # (prefetch_likely_next queues the new selection's batch once the page is drawn)
+    if st.session_state.get("prefetch_selection", (selected_pmid, selected_participants)) != (selected_pmid, selected_participants):
+        prefetcher.cancel(prefetch_session)
+
+    def emit_protocol_layout(layout):
+        """Streamlit adapter: draws one render.ProtocolLayout."""
+        if not layout.drawable:
+            if layout.warning:
+                st.warning(layout.warning)
+            return
+
+        if RENDER_MODE == "html":
+            st.markdown(layout.html, unsafe_allow_html=True)
+            return
+
+        st.subheader(layout.title)
+
+        if layout.cells:
+            for column, cell_html in zip(st.columns(render.CELL_COLUMN_WEIGHTS), layout.cells):
+                with column:
+                    st.markdown(cell_html, unsafe_allow_html=True)
+
+        columns = st.columns(layout.proportions)
+        for column, step in zip(columns, layout.steps):
+            with column:
+                st.markdown(step.label_html, unsafe_allow_html=True)
+                st.markdown(step.time_html, unsafe_allow_html=True)
+                st.markdown(step.content_html, unsafe_allow_html=True)
+
+        st.markdown(render.DIVIDER_HTML, unsafe_allow_html=True)
+
+    def page_controls(total):
+        """Page size / page number widgets for total rows; returns (page, page_size)."""
+        pager = st.columns([1, 1, 4])
+        with pager[0]:
+            page_size = st.selectbox(
+                "Protocols per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="page_size"
+            )
+        n_pages = page_count(total, page_size)
+        if st.session_state.get("page", 1) > n_pages:
+            st.session_state["page"] = n_pages
+        with pager[1]:
+            page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key="page")
+        return int(page), page_size
+
+    def plot_rows(rows, total, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """Emits the row positions of one page (of total matching rows)."""
+        if total > len(rows):
+            first = (page - 1) * page_size + 1
+            st.markdown(f"<p> Showing entries {first}-{first + len(rows) - 1} of {total} </p>", unsafe_allow_html=True)
+
+        with profiling.span("page.fragment_lookup"):
+            keys = [(table_version, int(row), toggles) for row in rows]
+            layouts = [fragment_cache.get(key) for key in keys]
+
+        # only cache misses touch the summary store and build HTML
+        missing = [i for i, layout in enumerate(layouts) if layout is None]
+        profiling.count("page.fragment_cache.hit", len(layouts) - len(missing))
+        profiling.count("page.fragment_cache.miss", len(missing))
+        with profiling.span("page.layout", rows=len(missing)):
+            for i, layout in zip(missing, render.layout_rows(df_submitted, summary_store, [rows[i] for i in missing], toggles)):
+                layouts[i] = layout
+                fragment_cache.put(keys[i], layout)
+
+        with profiling.span("page.emit", rows=len(layouts)):
+            for layout in layouts:
+                emit_protocol_layout(layout)
+
+    def plot_data_for_selection(selected_pmid, selected_participants, page=1, page_size=DEFAULT_PAGE_SIZE):
+        # only the visible page is fetched, laid out and emitted
+        with profiling.span("page.select_rows"):
+            rows, total = selection_index.page(selected_pmid, selected_participants, page, page_size)
+        plot_rows(rows, total, page, page_size)
+
+    def plot_search_results(query):
+        with profiling.span("search.query"):
+            clauses = parse_query(query)
+            reagent_index = load_reagent_index(csv_file)
+            matches = reagent_index.search(clauses)
+        st.markdown(f"<p> {len(matches)} protocols match <b>{html.escape(query)}</b> </p>", unsafe_allow_html=True)
+        with st.expander("Matched terms"):
+            for clause in clauses:
+                terms = reagent_index.matching_terms(clause)
+                st.write(f"{clause.field or 'any field'} ∋ {clause.term!r}: " + (", ".join(t for _, t in terms) or "no terms"))
+        if not len(matches):
+            return
+        page, page_size = page_controls(len(matches))
+        start = (page - 1) * page_size
+        plot_rows(matches[start:start + page_size], len(matches), page, page_size)
+
+    def build_comparison(pmid):
+        return compare.compare_pmid(df_submitted, selection_index.rows(pmid, SHOW_ALL), submissions.protocols, summary_store)
+
+    def plot_comparison(selected_pmid):
+        # every submission for the PMID is fetched, aligned and diffed in one batched pass, then cached
+        key = (table_version, selected_pmid)
+        comparison = comparison_cache.get(key)
+        profiling.count("compare.cache.hit" if comparison is not None else "compare.cache.miss")
+        if comparison is None:
+            with profiling.span("compare.compare_pmid"):
+                comparison = build_comparison(selected_pmid)
+            comparison_cache.put(key, comparison)
+
+        st.subheader(f"PMID: {selected_pmid} | {len(comparison.columns)} participants")
+        for warning in comparison.warnings:
+            st.warning(f"Skipping {warning}")
+        if len(comparison.columns) < 2:
+            st.info("Fewer than two participants have a drawable protocol for this PMID.")
+        st.dataframe(
+            comparison.agreement_table(),
+            hide_index=True,
+            column_config={
+                "rows_agreeing": st.column_config.ProgressColumn("Steps in full agreement", min_value=0.0, max_value=1.0, format="%.2f"),
+                "mean_similarity": st.column_config.ProgressColumn("Mean pairwise similarity", min_value=0.0, max_value=1.0, format="%.2f"),
+            },
+        )
+        st.markdown(render.layout_comparison(comparison, toggles), unsafe_allow_html=True)
+
+    rendered = st.session_state.get("rendered_selection")
+    if rendered is not None and rendered[0] == "search" and rendered[1] == query.strip():
+        plot_search_results(rendered[1])
+    elif rendered == (selected_pmid, selected_participants) and compare_active and selected_participants == SHOW_ALL:
+        plot_comparison(selected_pmid)
+    elif rendered == (selected_pmid, selected_participants):
+        page, page_size = page_controls(len(selection_index.rows(selected_pmid, selected_participants)))
+        plot_data_for_selection(selected_pmid, selected_participants, page, page_size)
+    else:
+        st.info("Select a PMID / Participant, then click **Load / Render selection** (or search above) to display protocols.")
+
+    # ----------------------------
+    # Background prefetch of likely-next selections
+    # ----------------------------
+    # Jobs run on prefetcher threads: they capture this run's table and caches and touch no
+    # Streamlit API. Submitted after the page is drawn so they never compete with it.
+    def warm_fragments(version, rows, toggles, cancel):
+        """Lays out and caches the given rows that are not cached yet, stopping when cancelled."""
+        missing = [int(row) for row in rows if (version, int(row), toggles) not in fragment_cache]
+        for row, layout in zip(missing, render.layout_rows(df_submitted, summary_store, missing, toggles)):
+            if cancel.is_set():
+                return
+            if RENDER_MODE == "html" and layout.drawable:
+                _ = layout.html  # cached on the layout, so the page only emits it (assigned: no Streamlit magic)
+            fragment_cache.put((version, row, toggles), layout)
+
+    def warm_comparison(version, pmid, cancel):
+        if not cancel.is_set() and (version, pmid) not in comparison_cache:
+            comparison_cache.put((version, pmid), build_comparison(pmid))
+
+    def prefetch_likely_next():
+        """
+        Queues what this session most likely renders next: the highlighted selection (or the
+        next page of the one on screen), then the first page of the neighbouring PMIDs.
+        Changing any widget cancels whatever is still queued for the previous state.
+        """
+        page_size = st.session_state.get("page_size", DEFAULT_PAGE_SIZE)
+        on_screen = rendered == (selected_pmid, selected_participants)
+        if compare_active and selected_participants == SHOW_ALL:
+            targets = ([] if on_screen else [selected_pmid]) + [p for p in neighbours(pmids, selected_pmid) if len(selection_index.participants_for(p)) > 1]
+            jobs = [functools.partial(warm_comparison, table_version, pmid) for pmid in targets]
+        else:
+            page = st.session_state.get("page", 1) + 1 if on_screen else 1
+            selections = [(selected_pmid, selected_participants, page)] + [(p, SHOW_ALL, 1) for p in neighbours(pmids, selected_pmid)]
+            pages = [selection_index.page(pmid, participant, n, page_size)[0] for pmid, participant, n in selections]
+            jobs = [functools.partial(warm_fragments, table_version, rows, toggles) for rows in pages if len(rows)]
+        signature = (table_version, selected_pmid, selected_participants, on_screen, compare_active, toggles, page_size, st.session_state.get("page"))
+        st.session_state["prefetch_selection"] = (selected_pmid, selected_participants)
+        if prefetcher.submit(prefetch_session, signature, jobs):
+            profiling.count("prefetch.jobs_queued", len(jobs))
+
+    prefetch_likely_next()
+finally:
+    # also when the run stops early (st.stop, st.rerun, an exception), so no Run is left open
+    finished_run = profiling.end_run()
 
 # ----------------------------
-# UI selection
+# Debug panel (opt-in, see profile_run above)
 # ----------------------------
-protocol_options = st.columns(2)
-pmids = sorted([p for p in df_submitted.publication_id.dropna().unique().tolist() if p is not None])
-
-with protocol_options[0]:
-    selected_pmid = st.selectbox("Select a PMID", pmids + ["show all"])
-
-if selected_pmid != "show all":
-    participants = sorted(
-        [p for p in df_submitted[df_submitted["publication_id"] == selected_pmid]["participant_id"].dropna().unique().tolist() if p is not None]
-    )
-else:
-    participants = sorted([p for p in df_submitted["participant_id"].dropna().unique().tolist() if p is not None])
-
-with protocol_options[1]:
-    selected_participants = st.selectbox("Select a Participant ID", ["show all"] + participants)
-
-st.write("Plotting parameters:")
-checks = st.columns(6)
-with checks[1]:
-    mediacheckbox = st.checkbox("Show media", value=True)
-with checks[2]:
-    supplementscheckbox = st.checkbox("Show supplements", value=True)
-with checks[3]:
-    gfcheckbox = st.checkbox("Show growth factors", value=True)
-with checks[4]:
-    matrixcheckbox = st.checkbox("Show culture matrix", value=True)
-with checks[5]:
-    markerscheckbox = st.checkbox("Show readout", value=True)
-with checks[0]:
-    cellcheckbox = st.checkbox("Show cell lines and targets", value=True)
-
-st.markdown("""<hr class="custom-divider">""", unsafe_allow_html=True)
-
-# Optional: don't do any heavy work until user clicks
-run = st.button("Load / Render selection", type="primary")
-
-def plot_data_for_selection(selected_pmid, selected_participants):
-    if selected_participants == "show all" and selected_pmid == "show all":
-        paper_submissions = df_submitted[:10]
-        st.markdown("<p> Showing first 10 entries </p>", unsafe_allow_html=True)
-    elif selected_participants == "show all":
-        paper_submissions = df_submitted[df_submitted["publication_id"] == selected_pmid]
-    elif selected_pmid == "show all":
-        paper_submissions = df_submitted[df_submitted["participant_id"] == selected_participants]
-    else:
-        paper_submissions = df_submitted[
-            (df_submitted["publication_id"] == selected_pmid) &
-            (df_submitted["participant_id"] == selected_participants)
-        ]
-
-    for submission in range(len(paper_submissions)):
-        entry = paper_submissions.iloc[submission]
-        pmid = entry["publication_id"]
-        participant_id = entry["participant_id"]
-
-        try:
-            protocol_info = parse_and_normalize_protocol(entry.get("merged_data", None))
-            if protocol_info is None:
-                continue
-
-            st.subheader(f"PMID: {pmid} | Participant ID: {participant_id}")
-
-            # --- cell line info ---
-            if cellcheckbox:
-                cell_blob = protocol_info.get("cellLine")
-                cell_data = json.loads(cell_blob) if isinstance(cell_blob, str) else (cell_blob or {})
-                cell_line_details = cell_data.get("cellLineDetails", []) or []
-                diff_targets = cell_data.get("differentiationTarget", []) or []
-
-                cell_lines = ", ".join(
-                    [process_string(d.get("cellLineName", "")).rstrip(".") for d in cell_line_details if d.get("cellLineName")]
-                ) or "Not specified"
-
-                target = ", ".join(
-                    [process_string(t.get("targetCell", "")).rstrip(".") for t in diff_targets if t.get("targetCell")]
-                ) or "Not specified"
-
-                col1, col2, col3 = st.columns([5, 0.5, 5])
-                with col1:
-                    st.markdown(
-                        f"""
-                        <div class="cell-box">
-                            <strong>Cells of Origin:</strong><br>
-                            {cell_lines}
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
-                with col2:
-                    st.markdown(
-                        """
-                        <div class="arrow-box">
-                        <span style='font-size:70px;'>&#8594;</span>
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
-                with col3:
-                    st.markdown(
-                        f"""
-                        <div class="cell-box">
-                            <strong>Target Cells:</strong><br>
-                            {target}
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
-
-            # --- steps ---
-            no_steps = list(protocol_info.keys())
-            for k in ["sequencingData", "cellLine"]:
-                if k in no_steps:
-                    no_steps.remove(k)
-
-            # culturing flag
-            try:
-                culturing = json.loads(protocol_info.get("0", "{}")).get("culturingProtocol", [{}])[0].get("isGiven", True)
-            except Exception:
-                culturing = True
-            if culturing is False and "0" in no_steps:
-                no_steps.remove("0")
-
-            lengths = []
-            labels_time = []
-
-            for step_key in no_steps:
-                step_blob = protocol_info.get(str(step_key), "{}")
-                step_data = json.loads(step_blob) if isinstance(step_blob, str) else (step_blob or {})
-                duration_str = (step_data.get("duration", [{}])[0].get("durationHours", "") or "")
-
-                duration_str = convert_number_words_to_digits(duration_str)
-
-                if "-" in duration_str and duration_str and duration_str[0].isalpha():
-                    duration_str = convert_to_duration_fixed(duration_str.lower())
-
-                if "week" in duration_str.lower():
-                    step_times = re.findall(r"\d+", duration_str)
-                    length_step = float(step_times[0]) * 7 * 24 if len(step_times) == 1 else np.mean([float(t) * 7 * 24 for t in step_times])
-                    label = f"{int(length_step)} hours"
-                elif "day" in duration_str.lower():
-                    step_times = re.findall(r"\d+", duration_str)
-                    length_step = float(step_times[0]) * 24 if len(step_times) == 1 else np.mean([float(t) * 24 for t in step_times])
-                    label = f"{int(length_step)} hours"
-                elif len(re.findall(r"\d+", duration_str)) == 0 or duration_str == "0":
-                    length_step = np.nan
-                    label = ""
-                else:
-                    step_times = [float(nr) for nr in re.findall(r"\d+\.\d+|\d+", duration_str)]
-                    if len(step_times) > 2 and "(" in duration_str:
-                        try:
-                            length_step = float(extract_number_in_parentheses(duration_str))
-                        except Exception:
-                            length_step = np.nan
-                    elif len(step_times) == 1:
-                        length_step = float(step_times[0])
-                    else:
-                        length_step = np.mean(step_times) if step_times else np.nan
-                    label = duration_str
-
-                if np.isnan(length_step):
-                    length_step = 35
-                    label = "Not specified"
-                elif "hours" not in label.lower():
-                    label = label + "\nhours"
-                else:
-                    label = label.replace(" hours", "\nhours")
-
-                if length_step < 35:
-                    length_step = 35
-
-                labels_time.append(label)
-                lengths.append(length_step)
-
-            total_length = sum(lengths) if lengths else 1.0
-            proportions = [l / total_length for l in lengths] if lengths else [1.0]
-
-            for i, prop in enumerate(proportions):
-                if prop < 0.1 and len(proportions) > 1:
-                    max_index = proportions.index(max(proportions))
-                    proportions[i] += 0.05
-                    proportions[max_index] -= 0.05
-                    if proportions[max_index] < 0.1:
-                        proportions[max_index] = 0.1
-
-            columns = st.columns(proportions)
-
-            for i, step_key in enumerate(no_steps):
-                if step_key == "0":
-                    container_class = "step-container-culturing"
-                    label = "Culturing"
-                else:
-                    container_class = "step-container"
-                    label = f"Step {step_key}"
-
-                step_blob = protocol_info.get(str(step_key), "{}")
-                step_data = json.loads(step_blob) if isinstance(step_blob, str) else (step_blob or {})
-
-                with columns[i]:
-                    st.markdown(f"<p class='small-text' style='text-align: center; font-weight: bold;'>{label}</p>", unsafe_allow_html=True)
-                    st.markdown(f"<p class='small-text' style='text-align: center;'>{labels_time[i]}</p>", unsafe_allow_html=True)
-
-                    step_content = f"""<div class="{container_class}">"""
-
-                    # Basal media
-                    if mediacheckbox:
-                        media = ""
-                        bm = step_data.get("basalMedia", []) or []
-                        for j in range(len(bm)):
-                            name = bm[j].get("name") if isinstance(bm[j], dict) else None
-                            if name and name not in ["-", "NA"]:
-                                media += name + ", "
-                        media = media.rstrip(", ") or "Not specified"
-                        step_content += f"<p><strong>Basal media:</strong></p><p>{media}</p><hr>"
-
-                    # Supplements
-                    if supplementscheckbox:
-                        supplements = ""
-                        ss = step_data.get("SerumAndSupplements", []) or []
-                        for j in range(len(ss)):
-                            name = ss[j].get("name") if isinstance(ss[j], dict) else None
-                            if name and name not in ["-", "NA"]:
-                                supplements += name + ", "
-                        supplements = supplements.rstrip(", ") or "Not specified"
-                        step_content += f"<p><strong>Serum and supplements:</strong></p><p>{supplements}</p><hr>"
-
-                    # Growth factors
-                    if gfcheckbox:
-                        gf = ""
-                        gfs = step_data.get("growthFactor", []) or []
-                        for j in range(len(gfs)):
-                            name = gfs[j].get("name") if isinstance(gfs[j], dict) else None
-                            if name and name not in ["-", "NA"]:
-                                gf += name + ", "
-                        gf = gf.rstrip(", ") or "Not specified"
-                        step_content += f"<p><strong>Growth factors:</strong></p><p>{gf}</p><hr>"
-
-                    # Culture matrix
-                    if matrixcheckbox:
-                        matrix = ""
-                        cm = step_data.get("cultureMatrix", []) or []
-                        for j in range(len(cm)):
-                            name = cm[j].get("name") if isinstance(cm[j], dict) else None
-                            if name and name not in ["-", "NA", "Not given"]:
-                                matrix += name + ", "
-                        matrix = matrix.rstrip(", ") or "Not specified"
-                        step_content += f"<p><strong>Culture matrix:</strong></p><p>{matrix}</p><hr>"
-
-                    step_content += "</div>"
-
-                    # Markers
-                    if markerscheckbox and step_key != "0":
-                        markers = ""
-                        gm = step_data.get("geneMarkers", []) or []
-                        for j in range(len(gm)):
-                            if not isinstance(gm[j], dict):
-                                continue
-                            name = gm[j].get("name")
-                            if name in ["-", "NA", "Not given", None]:
-                                continue
-
-                            markers += name
-                            if "geneEnrichment" in gm[j]:
-                                if gm[j]["geneEnrichment"] == "upregulated":
-                                    markers += " ↑"
-                                elif gm[j]["geneEnrichment"] == "downregulated":
-                                    markers += " ↓"
-                                elif gm[j]["geneEnrichment"] is None:
-                                    markers += " (direction not specified)"
-                            else:
-                                markers += " (direction not specified)"
-
-                            markers += ", "
-
-                        markers = markers.rstrip(", ") or "Not specified"
-                        step_content += f"""<div class="readout-container"><p><strong>Readout:</strong></p><p>{markers}</p></div>"""
-
-                    st.markdown(step_content, unsafe_allow_html=True)
-
-            st.markdown("""<hr class="custom-divider">""", unsafe_allow_html=True)
-
-        except Exception as e:
-            st.warning(f"Skipping PMID {pmid} | Participant ID {participant_id} due to error: {e}")
-            continue
-
-if run:
-    plot_data_for_selection(selected_pmid, selected_participants)
-else:
-    st.info("Select a PMID / Participant, then click **Load / Render selection** to parse and display protocols.")
+def emit_debug_panel(run):
+    if run is None:
+        return
+    with st.expander(f"Debug: timings for this run ({run.seconds * 1000:.0f} ms)", expanded=True):
+        st.dataframe(run.rows(), hide_index=True, use_container_width=True)
+        if run.counters:
+            st.dataframe([{"counter": name, "value": value} for name, value in sorted(run.counters.items())], hide_index=True)
+        caches = {"fragment cache": fragment_cache.stats(), "comparison cache": comparison_cache.stats()}
+        st.dataframe([{"cache": name, **stats} for name, stats in caches.items()], hide_index=True)
+        st.dataframe([{"prefetch": "jobs", **prefetcher.stats()}], hide_index=True)
+
+        spans, counters = profiling.totals()
+        st.caption("Process totals since start")
+        st.dataframe(spans, hide_index=True, use_container_width=True)
+        log_lines = [json.dumps(run.to_json(), default=str)] + [json.dumps(e, default=str) for e in profiling.recent_events()]
+        st.download_button(
+            "Download timing log (JSONL)", "\n".join(log_lines) + "\n",
+            file_name="extractor-timings.jsonl", mime="application/x-ndjson",
+        )
+
+emit_debug_panel(finished_run)
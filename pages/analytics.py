@@ -0,0 +1,63 @@
+import streamlit as st
+
+from appdata import load_aggregates
+
+st.set_page_config(layout="wide")
+st.title("Protocol analytics")
+
+# computed once per table version (and kept on disk), so this page only draws
+aggregates = load_aggregates()
+stats = aggregates.protocol_stats
+
+overview = st.columns(4)
+overview[0].metric("Protocols", len(stats))
+overview[1].metric("PMIDs", stats["publication_id"].nunique())
+overview[2].metric("Annotators", stats["participant_id"].nunique())
+overview[3].metric("Median duration (hours)", f"{stats['total_hours'].median():.0f}" if stats["total_hours"].notna().any() else "-")
+
+# ----------------------------
+# Growth factors per target cell type
+# ----------------------------
+st.subheader("Most common growth factors per target cell type")
+growth_factors = aggregates.growth_factors_by_target
+if len(growth_factors):
+    target_sizes = growth_factors.groupby("target", observed=True)["protocols"].max().sort_values(ascending=False)
+    target = st.selectbox("Target cell type", target_sizes.index.tolist())
+    top = growth_factors[growth_factors["target"] == target].head(10)
+    st.bar_chart(top, x="growth_factor", y="protocols", horizontal=True)
+    st.dataframe(top, hide_index=True, use_container_width=True)
+else:
+    st.info("No protocol names both a target cell type and a growth factor.")
+
+# ----------------------------
+# Step counts and durations
+# ----------------------------
+distributions = st.columns(2)
+with distributions[0]:
+    st.subheader("Steps per protocol")
+    st.bar_chart(aggregates.step_count_distribution, x="step_count", y="protocols")
+with distributions[1]:
+    st.subheader("Total protocol duration")
+    st.bar_chart(aggregates.duration_distribution, x="duration", y="protocols")
+    st.caption(
+        f"{int(stats['total_hours'].isna().sum())} protocols give no usable step duration; "
+        f"{int((stats['unspecified_steps'] > 0).sum())} have at least one step without one (counted as 0 hours)."
+    )
+
+# ----------------------------
+# Inter-annotator agreement
+# ----------------------------
+st.subheader("Inter-annotator agreement per PMID")
+st.caption(
+    "term_jaccard: mean pairwise overlap of the annotators' reagents, markers and cell lines; "
+    "step_count_match: share of annotator pairs reporting the same number of steps."
+)
+st.dataframe(
+    aggregates.pmid_agreement,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "term_jaccard": st.column_config.ProgressColumn("term_jaccard", min_value=0.0, max_value=1.0, format="%.2f"),
+        "step_count_match": st.column_config.ProgressColumn("step_count_match", min_value=0.0, max_value=1.0, format="%.2f"),
+    },
+)
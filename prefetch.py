@@ -0,0 +1,105 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+# Background threads shared by every session; 0 turns prefetching off
+DEFAULT_WORKERS = int(os.environ.get("EXTRACTOR_PREFETCH_WORKERS", "2"))
+# PMIDs on each side of the highlighted one (in the sorted selectbox order) to warm
+NEIGHBOURS = int(os.environ.get("EXTRACTOR_PREFETCH_NEIGHBOURS", "2"))
+
+class Prefetcher:
+    """
+    Bounded pool that warms shared caches with what a session is likely to open next.
+    Each session has at most one batch of jobs in flight: submitting a different batch
+    cancels the previous one (queued jobs are dropped, running ones see their cancel
+    Event set and stop at the next item). Jobs are best-effort; failures are counted
+    and otherwise ignored, the page simply computes the item itself.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") if workers > 0 else None
+        self._lock = threading.Lock()
+        self._batches = {}  # session -> (signature, cancel Event, futures)
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def _run(self, job, cancel: threading.Event):
+        if cancel.is_set():
+            with self._lock:
+                self.cancelled += 1
+            return
+        try:
+            with profiling.span("prefetch.job"):
+                job(cancel)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            if cancel.is_set():
+                self.cancelled += 1
+            else:
+                self.completed += 1
+
+    def _cancel(self, batch):
+        _, cancel, futures = batch
+        cancel.set()
+        self.cancelled += sum(future.cancel() for future in futures)
+
+    def submit(self, session: str, signature, jobs: list):
+        """
+        Queues jobs (callables taking the batch's cancel Event), in priority order, for
+        session. The same signature as the session's last batch is not queued again.
+        Returns True when the jobs were queued.
+        """
+        if self._pool is None:
+            return False
+        with self._lock:
+            current = self._batches.get(session)
+            if current is not None:
+                if current[0] == signature:
+                    return False
+                self._cancel(current)
+            cancel = threading.Event()
+            futures = [self._pool.submit(self._run, job, cancel) for job in jobs]
+            self._batches[session] = (signature, cancel, futures)
+            self.submitted += len(jobs)
+            # forget finished batches of other sessions (closed tabs never cancel theirs)
+            for other in [s for s, (_, _, fs) in self._batches.items() if s != session and all(f.done() for f in fs)]:
+                del self._batches[other]
+        return True
+
+    def cancel(self, session: str):
+        """Cancels session's batch in flight, if any."""
+        with self._lock:
+            batch = self._batches.pop(session, None)
+            if batch is not None:
+                self._cancel(batch)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(not f.done() for _, _, futures in self._batches.values() for f in futures)
+            return {
+                "workers": self.workers,
+                "pending": pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+            }
+
+def neighbours(items: list, item, n: int = NEIGHBOURS):
+    """Up to n entries of items on each side of item, nearest first (after, then before)."""
+    try:
+        at = items.index(item)
+    except ValueError:
+        return []
+    around = []
+    for distance in range(1, n + 1):
+        around += [items[i] for i in (at + distance, at - distance) if 0 <= i < len(items)]
+    return around
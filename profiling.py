@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+# Opt-in: EXTRACTOR_PROFILE=1 records everywhere; otherwise only script runs started with
+# start_run(enabled=True) (e.g. the app's ?debug=1) record. When nothing records, timed()
+# and span() cost one flag check.
+ENABLED = os.environ.get("EXTRACTOR_PROFILE", "").lower() in ("1", "true", "yes", "on")
+# Structured log: one JSON object per recorded span / run, appended here when set
+LOG_PATH = os.environ.get("EXTRACTOR_PROFILE_LOG") or None
+RECENT_EVENTS = 2000
+
+logger = logging.getLogger("extractor.profile")
+
+_local = threading.local()
+_lock = threading.Lock()
+_open_runs = 0  # runs started and not yet ended, in any thread; 0 keeps recording() to two global reads
+_totals = {}   # name -> [calls, seconds, max seconds], process-wide
+_counters = {} # name -> count, process-wide
+_recent = deque(maxlen=RECENT_EVENTS)
+
+class Run:
+    """Spans and counters recorded by one thread between start_run and end_run (one Streamlit rerun)."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        self.seconds = None
+        self.spans = {}      # name -> [calls, seconds, max seconds]
+        self.counters = {}   # name -> count
+        self.events = []     # {"name", "seconds", "meta"} in completion order
+
+    def rows(self):
+        """Per-span summary rows, slowest first."""
+        return sorted(
+            (
+                {"stage": name, "calls": calls, "total_ms": round(seconds * 1000, 3), "max_ms": round(longest * 1000, 3)}
+                for name, (calls, seconds, longest) in self.spans.items()
+            ),
+            key=lambda row: -row["total_ms"],
+        )
+
+    def to_json(self):
+        return {
+            "type": "run", "label": self.label, "started": self.started, "seconds": self.seconds,
+            "spans": self.rows(), "counters": dict(self.counters),
+        }
+
+def _run():
+    return getattr(_local, "run", None)
+
+def recording():
+    """True when this thread records: EXTRACTOR_PROFILE is on or it is inside a started run."""
+    return ENABLED or (_open_runs and getattr(_local, "run", None) is not None)
+
+def _write_log(record: dict):
+    line = json.dumps(record, default=str)
+    logger.debug(line)
+    if LOG_PATH:
+        try:
+            with _lock, open(LOG_PATH, "a") as fh:
+                fh.write(line + "\n")
+        except OSError:
+            pass
+
+def _record(name: str, seconds: float, meta: dict = None):
+    with _lock:
+        total = _totals.setdefault(name, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+        total[2] = max(total[2], seconds)
+    run = _run()
+    if run is not None:
+        stats = run.spans.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    # per-item spans (one per blob) would swamp the events and the log; totals still count them
+    if meta and meta.get("log") is False:
+        return
+    event = {"type": "span", "name": name, "seconds": seconds, "ts": time.time(), "meta": meta or None}
+    if run is not None:
+        event["run"] = run.label
+        run.events.append(event)
+    _recent.append(event)
+    if LOG_PATH:
+        _write_log(event)
+
+# ----------------------------
+# Instrumentation API
+# ----------------------------
+@contextmanager
+def span(name: str, **meta):
+    """Times the with-block as name when recording; otherwise just runs it."""
+    if not recording():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start, meta)
+
+def timed(name: str = None, log: bool = True):
+    """
+    Decorator: records each call as a span named name (default module.function).
+    log=False keeps per-call spans of hot, per-item functions out of the structured log.
+    """
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+        meta = None if log else {"log": False}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recording():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(label, time.perf_counter() - start, meta)
+        return wrapper
+    return decorate
+
+def count(name: str, n: int = 1):
+    """Adds n to counter name (cache hits, misses, rows...) when recording."""
+    if not recording():
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    run = _run()
+    if run is not None:
+        run.counters[name] = run.counters.get(name, 0) + n
+
+# ----------------------------
+# Runs (one per Streamlit rerun)
+# ----------------------------
+def start_run(label: str, enabled: bool = None):
+    """
+    Starts recording this thread's spans into a new Run (returned), or returns None when
+    enabled is False and EXTRACTOR_PROFILE is off. Pair with end_run.
+    """
+    global _open_runs
+    if _run() is not None:
+        end_run()  # the previous rerun of this thread stopped early (st.stop, exception)
+    if not (enabled or ENABLED):
+        return None
+    with _lock:
+        _open_runs += 1
+    _local.run = Run(label)
+    return _local.run
+
+def end_run():
+    """Stops this thread's Run, logs its totals, and returns it (None if none was started)."""
+    global _open_runs
+    run = _run()
+    _local.run = None
+    if run is not None:
+        with _lock:
+            _open_runs -= 1
+        run.seconds = time.time() - run.started
+        if LOG_PATH:
+            _write_log(run.to_json())
+    return run
+
+def requested(query_params) -> bool:
+    """True when the page was opened with ?debug=1 (or ?profile=1)."""
+    value = query_params.get("debug") or query_params.get("profile")
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def totals():
+    """Process-wide span totals and counters since start (or reset)."""
+    with _lock:
+        spans = [
+            {"stage": name, "calls": calls, "total_ms": round(seconds * 1000, 3), "max_ms": round(longest * 1000, 3)}
+            for name, (calls, seconds, longest) in _totals.items()
+        ]
+        return sorted(spans, key=lambda row: -row["total_ms"]), dict(_counters)
+
+def recent_events():
+    with _lock:
+        return list(_recent)
+
+def reset():
+    with _lock:
+        _totals.clear()
+        _counters.clear()
+        _recent.clear()
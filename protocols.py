@@ -0,0 +1,372 @@
+import os
+import re
+import ast
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+import durations
+import profiling
+
+# Non-step keys that are kept even when empty (raw and already-renamed spellings)
+KEYS_TO_RETAIN = {"0", "1001", "-1", "sequencingData", "cellLine"}
+NON_STEP_KEYS = ["sequencingData", "cellLine"]
+
+# Process pool settings; EXTRACTOR_WORKERS=1 forces the serial path
+PARALLEL_MIN_ITEMS = 1000  # below this, pool start-up costs more than it saves
+CHUNK_SIZE = 32
+# Never fork: the pool also starts inside the Streamlit server, whose other threads
+# (tornado, prefetch / export pools, pyarrow) may hold locks a forked child would inherit
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def process_string(s: str):
+    return re.sub(r"\s+", " ", s or "").strip()
+
+def is_empty_or_null(item):
+    if isinstance(item, dict):
+        return all(is_empty_or_null(v) for v in item.values())
+    if isinstance(item, list):
+        return all(is_empty_or_null(v) for v in item)
+    return item in [None, "", False]
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+# ----------------------------
+# Blob decoding
+# ----------------------------
+def decode_blob(raw: str):
+    """
+    Decodes one merged_data string. Two formats occur in the exports:
+    JSON ({"0": "..."}) and a Python dict repr ({'0': '...'}), which json.loads rejects.
+    The first quote character picks the decoder, so neither format pays for a failed attempt.
+    """
+    text = raw.strip()
+    if text[:2] == "{'":
+        return ast.literal_eval(text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        # e.g. a repr that starts with whitespace or an odd key; literal_eval is the safe fallback
+        return ast.literal_eval(text)
+
+def normalize_protocol(merged_raw):
+    """
+    Strict version of parse_and_normalize_protocol: returns None for an empty blob,
+    raises ValueError describing the problem for a malformed one.
+    Every step value in the result is a decoded dict; nothing downstream needs json.loads.
+    """
+    if _is_missing(merged_raw):
+        return None
+    if isinstance(merged_raw, (bytes, bytearray)):
+        merged_raw = merged_raw.decode("utf-8", errors="replace")
+    if isinstance(merged_raw, str):
+        if merged_raw.strip() == "":
+            return None
+        try:
+            dictentry = decode_blob(merged_raw)
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"undecodable merged_data: {e}") from None
+    elif isinstance(merged_raw, dict):
+        dictentry = dict(merged_raw)
+    else:
+        raise ValueError(f"unsupported merged_data type {type(merged_raw).__name__}")
+
+    if not isinstance(dictentry, dict):
+        raise ValueError(f"merged_data is a {type(dictentry).__name__}, expected a dict")
+
+    # decode inner step blobs once
+    for key, value in dictentry.items():
+        if isinstance(value, str):
+            try:
+                dictentry[key] = json.loads(value) if value.strip() else {}
+            except ValueError as e:
+                raise ValueError(f"step {key!r}: invalid JSON: {e}") from None
+
+    # REMOVE EMPTY KEYS (keeping 0, 1001, -1)
+    keys_to_remove = [
+        key for key, value in dictentry.items()
+        if key not in KEYS_TO_RETAIN and is_empty_or_null(value)
+    ]
+    for key in keys_to_remove:
+        dictentry.pop(key, None)
+
+    # step count calc as in your original logic
+    newstepcount = len(dictentry) - 1 - 1 - 1
+
+    # rename keys for consistency with downstream code
+    if "1000" in dictentry:
+        dictentry[str(newstepcount)] = dictentry.pop("1000")
+    if "1001" in dictentry:
+        dictentry["sequencingData"] = dictentry.pop("1001")
+    if "-1" in dictentry:
+        dictentry["cellLine"] = dictentry.pop("-1")
+
+    return dictentry
+
+@profiling.timed("protocols.parse_and_normalize_protocol", log=False)
+def parse_and_normalize_protocol(merged_raw):
+    """
+    Returns dictentry (dict) or None.
+    """
+    try:
+        return normalize_protocol(merged_raw)
+    except Exception:
+        return None
+
+# ----------------------------
+# Per-step extraction (durations, reagents, markers)
+# ----------------------------
+def _listed(items):
+    # a few submissions store a single entry as a bare dict instead of a one-item list
+    return [items] if isinstance(items, dict) else (items or [])
+
+def _names(items, skip=("-", "NA")):
+    names = ""
+    for item in _listed(items):
+        name = item.get("name") if isinstance(item, dict) else None
+        if name and name not in skip:
+            names += name + ", "
+    return names.rstrip(", ") or "Not specified"
+
+def _markers(items):
+    markers = ""
+    for marker in _listed(items):
+        if not isinstance(marker, dict):
+            continue
+        name = marker.get("name")
+        if name in ["-", "NA", "Not given", None]:
+            continue
+
+        markers += name
+        if "geneEnrichment" in marker:
+            if marker["geneEnrichment"] == "upregulated":
+                markers += " ↑"
+            elif marker["geneEnrichment"] == "downregulated":
+                markers += " ↓"
+            elif marker["geneEnrichment"] is None:
+                markers += " (direction not specified)"
+        else:
+            markers += " (direction not specified)"
+
+        markers += ", "
+    return markers.rstrip(", ") or "Not specified"
+
+def step_keys(protocol_info: dict):
+    """Keys of the steps to draw, in order; the culturing step "0" is dropped when not given."""
+    no_steps = [k for k in protocol_info.keys() if k not in NON_STEP_KEYS]
+    try:
+        culturing = (protocol_info.get("0") or {}).get("culturingProtocol", [{}])[0].get("isGiven", True)
+    except Exception:
+        culturing = True
+    if culturing is False and "0" in no_steps:
+        no_steps.remove("0")
+    return no_steps
+
+def summarize_protocol(protocol_info: dict):
+    """
+    Flattens a normalized protocol into the plain strings/numbers the page displays.
+    The result only holds builtins, so it pickles cheaply across processes.
+    Step lengths are left empty; run fill_step_lengths over the batch afterwards.
+    """
+    cell_data = protocol_info.get("cellLine") or {}
+    cell_line_details = cell_data.get("cellLineDetails", []) or []
+    diff_targets = cell_data.get("differentiationTarget", []) or []
+
+    steps = []
+    for step_key in step_keys(protocol_info):
+        step_data = protocol_info.get(str(step_key)) or {}
+        duration_str = (step_data.get("duration", [{}])[0].get("durationHours", "") or "")
+        steps.append({
+            "key": step_key,
+            "duration": duration_str,
+            "length": None,      # filled in batches by fill_step_lengths
+            "time_label": None,
+            "media": _names(step_data.get("basalMedia")),
+            "supplements": _names(step_data.get("SerumAndSupplements")),
+            "growth_factors": _names(step_data.get("growthFactor")),
+            "matrix": _names(step_data.get("cultureMatrix"), skip=("-", "NA", "Not given")),
+            "markers": _markers(step_data.get("geneMarkers")),
+        })
+
+    return {
+        "cell_lines": ", ".join(
+            [process_string(d.get("cellLineName", "")).rstrip(".") for d in cell_line_details if d.get("cellLineName")]
+        ) or "Not specified",
+        "targets": ", ".join(
+            [process_string(t.get("targetCell", "")).rstrip(".") for t in diff_targets if t.get("targetCell")]
+        ) or "Not specified",
+        "steps": steps,
+    }
+
+# ----------------------------
+# Searchable terms (see search.ReagentIndex)
+# ----------------------------
+REAGENT_FIELDS = [
+    # (index field, step key)
+    ("media", "basalMedia"),
+    ("supplement", "SerumAndSupplements"),
+    ("growth_factor", "growthFactor"),
+    ("matrix", "cultureMatrix"),
+]
+MARKER_DIRECTION_FIELDS = {"upregulated": "marker_up", "downregulated": "marker_down"}
+PLACEHOLDER_TERMS = {"", "-", "na", "n/a", "none", "not given", "not specified", "(not given)", "(not specified)"}
+
+def index_term(text):
+    """Search-normalized form of a name (process_string, casefolded); None for placeholders."""
+    if not isinstance(text, str):
+        return None
+    term = process_string(text).rstrip(".").casefold()
+    return None if term in PLACEHOLDER_TERMS else term
+
+def protocol_terms(protocol_info: dict):
+    """
+    Set of (field, term) pairs a normalized protocol can be found by: reagent names per
+    REAGENT_FIELDS, gene markers ("marker", plus "marker_up"/"marker_down" by direction),
+    and cell lines / targets ("cell_line", "target").
+    """
+    terms = set()
+
+    def add(field, text):
+        term = index_term(text)
+        if term:
+            terms.add((field, term))
+
+    for step_key in step_keys(protocol_info):
+        step_data = protocol_info.get(str(step_key))
+        if not isinstance(step_data, dict):
+            continue
+        for field, key in REAGENT_FIELDS:
+            for item in _listed(step_data.get(key)):
+                if isinstance(item, dict):
+                    add(field, item.get("name"))
+        for marker in _listed(step_data.get("geneMarkers")):
+            if isinstance(marker, dict):
+                add("marker", marker.get("name"))
+                direction_field = MARKER_DIRECTION_FIELDS.get(marker.get("geneEnrichment"))
+                if direction_field:
+                    add(direction_field, marker.get("name"))
+
+    cell_data = protocol_info.get("cellLine") or {}
+    for detail in _listed(cell_data.get("cellLineDetails")):
+        if isinstance(detail, dict):
+            add("cell_line", detail.get("cellLineName"))
+    for target in _listed(cell_data.get("differentiationTarget")):
+        if isinstance(target, dict):
+            add("target", target.get("targetCell"))
+    return terms
+
+MARKER_ARROWS = {"upregulated": " ↑", "downregulated": " ↓"}
+
+def step_entries(step_data: dict):
+    """
+    {field: [(name, term), ...]} for one step, with fields as in REAGENT_FIELDS plus "marker".
+    name is for display, term its index_term; marker names and terms carry the direction
+    ("NKX2-5 ↑" / "nkx2-5 ↑"). Placeholders are left out. Used to align and diff steps.
+    """
+    entries = {}
+    for field, key in REAGENT_FIELDS:
+        entries[field] = []
+        for item in _listed(step_data.get(key)):
+            term = index_term(item.get("name")) if isinstance(item, dict) else None
+            if term:
+                entries[field].append((process_string(item["name"]), term))
+
+    entries["marker"] = []
+    for marker in _listed(step_data.get("geneMarkers")):
+        term = index_term(marker.get("name")) if isinstance(marker, dict) else None
+        if term:
+            arrow = MARKER_ARROWS.get(marker.get("geneEnrichment"), "")
+            entries["marker"].append((process_string(marker["name"]) + arrow, term + arrow))
+    return entries
+
+def fill_step_lengths(summaries):
+    """
+    Sets "length"/"time_label" on every step of every summary (None entries are skipped)
+    with a single vectorized durations.normalize_durations pass. Returns summaries.
+    """
+    steps = [step for summary in summaries if summary for step in summary["steps"]]
+    if steps:
+        hours, labels = durations.normalize_durations(pd.Series([step["duration"] for step in steps], dtype=object))
+        for step, length, label in zip(steps, hours.tolist(), labels.tolist()):
+            step["length"] = length
+            step["time_label"] = label
+    return summaries
+
+def process_blob(merged_raw):
+    """Normalizes and summarizes one blob; returns {"protocol", "summary", "error"}."""
+    record = {"protocol": None, "summary": None, "error": None}
+    try:
+        record["protocol"] = normalize_protocol(merged_raw)
+        if record["protocol"] is not None:
+            record["summary"] = summarize_protocol(record["protocol"])
+    except Exception as e:
+        record["error"] = str(e) or type(e).__name__
+    return record
+
+def summarize_record(protocol_info):
+    """summarize_protocol without raising; returns {"summary", "error"}."""
+    record = {"summary": None, "error": None}
+    if protocol_info is None:
+        return record
+    try:
+        record["summary"] = summarize_protocol(protocol_info)
+    except Exception as e:
+        record["error"] = str(e) or type(e).__name__
+    return record
+
+# ----------------------------
+# Parallel map over chunks (serial fallback, input order preserved)
+# ----------------------------
+def default_workers():
+    try:
+        return max(1, int(os.environ.get("EXTRACTOR_WORKERS", "")))
+    except ValueError:
+        return os.cpu_count() or 1
+
+def _apply_chunk(args):
+    func, chunk = args
+    return [func(item) for item in chunk]
+
+def parallel_map(func, items, workers: int = None, chunk_size: int = CHUNK_SIZE):
+    """
+    [func(x) for x in items], spread over a process pool in chunks.
+    func must be a picklable module-level function. Results keep input order.
+    Small inputs, workers=1 or a pool that cannot start fall back to a serial loop.
+    """
+    items = list(items)
+    workers = default_workers() if workers is None else max(1, workers)
+    if workers == 1 or len(items) < PARALLEL_MIN_ITEMS:
+        return [func(item) for item in items]
+
+    chunks = [(func, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+    try:
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver":
+            context.set_forkserver_preload([__name__])  # workers fork with pandas already imported
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context) as pool:
+            results = []
+            for chunk_result in pool.map(_apply_chunk, chunks):
+                results.extend(chunk_result)
+            return results
+    except (OSError, RuntimeError):
+        # no process start available (sandboxes, some hosts) or the pool broke
+        return [func(item) for item in items]
+
+@profiling.timed("protocols.process_blobs")
+def process_blobs(blobs, workers: int = None):
+    """process_blob for each blob, in parallel when there are many, with step lengths filled in."""
+    records = parallel_map(process_blob, blobs, workers)
+    fill_step_lengths([r["summary"] for r in records])
+    return records
+
+@profiling.timed("protocols.summarize_protocols")
+def summarize_protocols(protocols, workers: int = None):
+    """summarize_record for each normalized protocol, in parallel when there are many, with step lengths filled in."""
+    records = parallel_map(summarize_record, protocols, workers)
+    fill_step_lengths([r["summary"] for r in records])
+    return records
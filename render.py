@@ -0,0 +1,326 @@
+# Headless protocol rendering: summaries in, layout models (proportions, labels,
+# per-section HTML) out. Nothing here imports Streamlit; mainapp.py only emits layouts.
+import html
+from functools import cached_property
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+# ----------------------------
+# CSS
+# ----------------------------
+CSS = """
+<style>
+.step-container-culturing {
+    padding: 10px;
+    border-radius: 10px;
+    background-color: #FFD9AD;
+    margin-bottom: 20px;
+    color: black;
+}
+.step-container {
+    padding: 10px;
+    border-radius: 10px;
+    background-color:  #DFE5FF;
+    margin-bottom: 20px;
+    color: black;
+}
+.readout-container {
+    padding: 10px;
+    border-radius: 10px;
+    background-color: #EAFFE4;
+    margin-bottom: 20px;
+    color: black;
+}
+.participant-container {
+    padding: 5px;
+    border-radius: 10px;
+    background-color: #FFFFF;
+    margin-bottom: 5px;
+}
+.participant-title {
+    font-size: 20px;
+    font-weight: bold;
+    text-align: center;
+}
+.custom-divider {
+    border: none;
+    height: 20px;
+    background-color: #001158;
+    margin: 0px 0;
+}
+.cell-box {
+    border-radius: 10px;
+    padding: 10px;
+    background-color: #FAE8F1;
+    text-align: center;
+    margin: 10px;
+}
+.compare-table {
+    width: 100%;
+    border-collapse: separate;
+    border-spacing: 6px;
+    color: black;
+}
+.compare-table th {
+    text-align: center;
+    vertical-align: top;
+}
+.compare-table td {
+    vertical-align: top;
+    padding: 8px;
+    border-radius: 10px;
+    background-color: #DFE5FF;
+}
+.compare-table td.compare-missing {
+    background-color: #F2F2F2;
+    text-align: center;
+}
+.compare-diff {
+    border-left: 4px solid #E8590C;
+    padding-left: 6px;
+}
+.compare-table mark {
+    background-color: #FFE08A;
+}
+.protocol-row {
+    display: flex;
+    gap: 1rem;
+    align-items: flex-start;
+}
+.protocol-row > div {
+    min-width: 0;
+}
+.arrow-box {
+    text-align: center;
+    display: flex;
+    font-size: 60px;
+    margin: 0 auto;
+    line-height: 1;
+    align-items: center;
+    justify-content: center;
+}
+</style>
+"""
+
+DIVIDER_HTML = """<hr class="custom-divider">"""
+
+ARROW_HTML = """
+<div class="arrow-box">
+<span style='font-size:70px;'>&#8594;</span>
+</div>
+"""
+
+CELL_COLUMN_WEIGHTS = [5, 0.5, 5]
+
+# ----------------------------
+# Layout model
+# ----------------------------
+class Toggles(NamedTuple):
+    """The page's display checkboxes; hashable, so it can be part of a cache key."""
+    cells: bool = True
+    media: bool = True
+    supplements: bool = True
+    growth_factors: bool = True
+    matrix: bool = True
+    markers: bool = True
+
+@dataclass
+class StepLayout:
+    key: str
+    label: str                # "Culturing" / "Step 3"
+    time_label: str           # "72\nhours" / "Not specified"
+    container_class: str
+    sections: dict = field(default_factory=dict)  # section name -> inner HTML, in display order
+    readout: str = None       # readout HTML, shown under the step container
+
+    @property
+    def label_html(self):
+        return f"<p class='small-text' style='text-align: center; font-weight: bold;'>{self.label}</p>"
+
+    @property
+    def time_html(self):
+        return f"<p class='small-text' style='text-align: center;'>{self.time_label}</p>"
+
+    @property
+    def content_html(self):
+        return f"""<div class="{self.container_class}">""" + "".join(self.sections.values()) + "</div>" + (self.readout or "")
+
+@dataclass
+class ProtocolLayout:
+    pmid: str
+    participant_id: str
+    title: str = None
+    cells: tuple = None       # (origin HTML, arrow HTML, target HTML) or None when hidden
+    proportions: list = field(default_factory=list)
+    steps: list = field(default_factory=list)
+    warning: str = None       # set for submissions that cannot be drawn
+
+    @property
+    def drawable(self):
+        return self.title is not None
+
+    @cached_property
+    def html(self):
+        """The whole protocol as one HTML fragment (see protocol_html); built once per cached layout."""
+        return protocol_html(self)
+
+# ----------------------------
+# Layout engine
+# ----------------------------
+SECTIONS = [
+    # (toggle, section name, summary field, heading)
+    ("media", "media", "media", "Basal media"),
+    ("supplements", "supplements", "supplements", "Serum and supplements"),
+    ("growth_factors", "growth_factors", "growth_factors", "Growth factors"),
+    ("matrix", "matrix", "matrix", "Culture matrix"),
+]
+
+def step_proportions(lengths):
+    """Relative column widths for the step timeline; narrow steps are widened to stay readable."""
+    total_length = sum(lengths) if lengths else 1.0
+    proportions = [l / total_length for l in lengths] if lengths else [1.0]
+
+    for i, prop in enumerate(proportions):
+        if prop < 0.1 and len(proportions) > 1:
+            max_index = proportions.index(max(proportions))
+            proportions[i] += 0.05
+            proportions[max_index] -= 0.05
+            if proportions[max_index] < 0.1:
+                proportions[max_index] = 0.1
+    return proportions
+
+def _cell_box(heading: str, text: str):
+    return f"""
+<div class="cell-box">
+    <strong>{heading}:</strong><br>
+    {text}
+</div>
+"""
+
+def layout_step(step: dict, toggles: Toggles):
+    step_key = step["key"]
+    if step_key == "0":
+        layout = StepLayout(step_key, "Culturing", step["time_label"], "step-container-culturing")
+    else:
+        layout = StepLayout(step_key, f"Step {step_key}", step["time_label"], "step-container")
+
+    for toggle, name, summary_field, heading in SECTIONS:
+        if getattr(toggles, toggle):
+            layout.sections[name] = f"<p><strong>{heading}:</strong></p><p>{step[summary_field]}</p><hr>"
+
+    if toggles.markers and step_key != "0":
+        layout.readout = f"""<div class="readout-container"><p><strong>Readout:</strong></p><p>{step['markers']}</p></div>"""
+    return layout
+
+def layout_protocol(pmid, participant_id, summary, toggles: Toggles = Toggles(), error: str = None):
+    """
+    Lays out one submission from its summary (protocols.summarize_protocol, lengths filled).
+    Never raises: submissions that cannot be drawn get a layout with only .warning set
+    (None when the blob was simply empty).
+    """
+    layout = ProtocolLayout(pmid, participant_id)
+    if summary is None:
+        if error:
+            layout.warning = f"Skipping PMID {pmid} | Participant ID {participant_id}: {error}"
+        return layout
+
+    try:
+        cells = None
+        if toggles.cells:
+            cells = (
+                _cell_box("Cells of Origin", summary["cell_lines"]),
+                ARROW_HTML,
+                _cell_box("Target Cells", summary["targets"]),
+            )
+        steps = [layout_step(step, toggles) for step in summary["steps"]]
+        proportions = step_proportions([step["length"] for step in summary["steps"]])
+    except Exception as e:
+        layout.warning = f"Skipping PMID {pmid} | Participant ID {participant_id} due to error: {e}"
+        return layout
+
+    layout.title = f"PMID: {pmid} | Participant ID: {participant_id}"
+    layout.cells = cells
+    layout.steps = steps
+    layout.proportions = proportions
+    return layout
+
+def layout_rows(df, summaries, rows, toggles: Toggles = Toggles(), error_column: str = "parse_error"):
+    """
+    Yields a ProtocolLayout per row position, e.g. to render a whole table offline:
+    layout_rows(submissions.df, submissions.summaries, range(len(submissions.df))).
+    """
+    rows = [int(r) for r in rows]
+    # row positions index df; df's index labels address the summary store
+    for row, summary in zip(rows, summaries.take(df.index[rows])):
+        entry = df.iloc[row]
+        error = entry.get(error_column) if error_column in df.columns else None
+        yield layout_protocol(entry["publication_id"], entry["participant_id"], summary, toggles, error)
+
+# ----------------------------
+# Single-fragment rendering (one element per protocol instead of one per cell)
+# ----------------------------
+def _flex_row(weights, cells):
+    # flex-grow from zero basis splits the row by weight, like st.columns(weights)
+    return "<div class='protocol-row'>" + "".join(
+        f"<div style='flex: {weight:.6g} 1 0'>{cell}</div>" for weight, cell in zip(weights, cells)
+    ) + "</div>"
+
+def protocol_html(layout: ProtocolLayout):
+    """
+    One drawable layout as a single HTML fragment: title, cell boxes and step timeline
+    (flexbox in place of st.columns), then the divider. Collapsed to one line so Markdown
+    never reads indented HTML as a code block.
+    """
+    parts = [f"<h3>{html.escape(layout.title)}</h3>"]
+    if layout.cells:
+        parts.append(_flex_row(CELL_COLUMN_WEIGHTS, layout.cells))
+    parts.append(_flex_row(layout.proportions, [step.label_html + step.time_html + step.content_html for step in layout.steps]))
+    parts.append(DIVIDER_HTML)
+    return " ".join(line.strip() for line in "".join(parts).splitlines() if line.strip())
+
+# ----------------------------
+# Annotator comparison (see compare.Comparison)
+# ----------------------------
+COMPARE_SECTIONS = [
+    # (toggle, compare field, heading); None = always shown
+    (None, "duration", "Duration"),
+    ("media", "media", "Basal media"),
+    ("supplements", "supplement", "Serum and supplements"),
+    ("growth_factors", "growth_factor", "Growth factors"),
+    ("matrix", "matrix", "Culture matrix"),
+    ("markers", "marker", "Readout"),
+]
+
+def _compare_section(row, step, name: str, heading: str):
+    css = " class='compare-diff'" if row.agreement.get(name) is False else ""
+    if name == "duration":
+        text = html.escape(step.time_label.replace("\n", " "))
+    else:
+        # terms some other annotator of this step does not list are marked
+        shared = frozenset.intersection(*(other.terms(name) for other in row.steps.values()))
+        names = [
+            html.escape(label) if term in shared or len(row.steps) < 2 else f"<mark>{html.escape(label)}</mark>"
+            for label, term in step.entries.get(name, [])
+        ]
+        text = ", ".join(names) or "Not specified"
+    return f"<div{css}><p><strong>{heading}:</strong> {text}</p></div>"
+
+def layout_comparison(comparison, toggles: Toggles = Toggles()):
+    """
+    HTML table for a compare.Comparison: one column per annotator, one row per aligned
+    step. Fields the annotators disagree on get a side bar; names not every annotator
+    of that step lists are highlighted.
+    """
+    sections = [(name, heading) for toggle, name, heading in COMPARE_SECTIONS if toggle is None or getattr(toggles, toggle)]
+    head = "".join(f"<th>Participant ID: {html.escape(column)}</th>" for column in comparison.columns)
+    body = []
+    for row in comparison.rows:
+        cells = []
+        for column in comparison.columns:
+            step = row.steps.get(column)
+            if step is None:
+                cells.append("<td class='compare-missing'>&mdash;</td>")
+            else:
+                cells.append("<td>" + "".join(_compare_section(row, step, name, heading) for name, heading in sections) + "</td>")
+        body.append(f"<tr><th>{html.escape(row.label)}</th>{''.join(cells)}</tr>")
+    return f"<table class='compare-table'><thead><tr><th></th>{head}</tr></thead><tbody>{''.join(body)}</tbody></table>"
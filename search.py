@@ -0,0 +1,135 @@
+import re
+from typing import NamedTuple
+import numpy as np
+
+from protocols import index_term, protocol_terms
+
+# Query prefixes ("marker: NKX2-5") -> index field
+FIELD_ALIASES = {
+    "media": "media", "medium": "media", "basalmedia": "media",
+    "supplement": "supplement", "supplements": "supplement", "serum": "supplement",
+    "growth_factor": "growth_factor", "growthfactor": "growth_factor", "gf": "growth_factor",
+    "matrix": "matrix", "culturematrix": "matrix",
+    "marker": "marker", "markers": "marker", "readout": "marker", "gene": "marker",
+    "cell_line": "cell_line", "cellline": "cell_line", "cell": "cell_line",
+    "target": "target", "targetcell": "target",
+}
+# Trailing direction words on a marker clause ("NKX2-5 up", "marker: SOX17 ↓")
+UP_WORDS = {"↑", "up", "upregulated"}
+DOWN_WORDS = {"↓", "down", "downregulated"}
+# Without a field prefix only unambiguous directions turn a clause into a marker clause
+BARE_DIRECTIONS = {"↑": "marker_up", "upregulated": "marker_up", "↓": "marker_down", "downregulated": "marker_down"}
+
+CLAUSE_SPLIT_RE = re.compile(r"\s*[&;]\s*")
+FIELD_PREFIX_RE = re.compile(r"^\s*([A-Za-z_]+)\s*:\s*(.*)$")
+
+class Clause(NamedTuple):
+    field: str       # index field, or None for any field
+    term: str        # search-normalized text (see protocols.index_term)
+    exact: bool      # whole-term match instead of substring
+
+def parse_query(text: str):
+    """
+    Splits a search box query into Clauses; all clauses must match (AND).
+    Clauses are separated by "&" or ";", may start with a field ("gf: CHIR99021"),
+    and are substring matches unless quoted. Marker clauses may end with a direction,
+    e.g. "CHIR99021 & NKX2-5 upregulated" or "marker: SOX17 down".
+    """
+    clauses = []
+    for part in CLAUSE_SPLIT_RE.split(text or ""):
+        field = None
+        prefixed = FIELD_PREFIX_RE.match(part)
+        if prefixed and prefixed.group(1).lower() in FIELD_ALIASES:
+            field = FIELD_ALIASES[prefixed.group(1).lower()]
+            part = prefixed.group(2)
+
+        words = part.split()
+        if len(words) > 1:
+            last = words[-1].casefold()
+            if field == "marker" and last in UP_WORDS | DOWN_WORDS:
+                field = "marker_up" if last in UP_WORDS else "marker_down"
+                part = " ".join(words[:-1])
+            elif field is None and last in BARE_DIRECTIONS:
+                field = BARE_DIRECTIONS[last]
+                part = " ".join(words[:-1])
+
+        part = part.strip()
+        exact = len(part) > 1 and part[0] == part[-1] == '"'
+        term = index_term(part.strip('"'))
+        if term:
+            clauses.append(Clause(field, term, exact))
+    return clauses
+
+class ReagentIndex:
+    """
+    Inverted index from reagent / marker / cell line terms to row positions, built once
+    from the normalized protocols so a query only scans the (small) vocabulary and
+    intersects sorted position arrays; no blob is decoded at query time.
+    Row positions are positional, like SelectionIndex (usable with df.iloc).
+    """
+
+    def __init__(self, protocols):
+        postings = {}
+        n_rows = 0
+        for row, protocol in enumerate(protocols):
+            n_rows = row + 1
+            if not protocol:
+                continue
+            try:
+                terms = protocol_terms(protocol)
+            except Exception:
+                continue  # an odd protocol is just not searchable
+            for field, term in terms:
+                postings.setdefault(field, {}).setdefault(term, []).append(row)
+
+        self.n_rows = n_rows
+        self.postings = {
+            field: {term: np.asarray(rows, dtype=np.intp) for term, rows in terms.items()}
+            for field, terms in postings.items()
+        }
+        self.vocabulary = {field: sorted(terms) for field, terms in self.postings.items()}
+
+    @classmethod
+    def from_store(cls, protocol_store, labels):
+        """Index over the protocols at labels (e.g. df.index), in that order."""
+        return cls(protocol_store.take(labels))
+
+    def lookup(self, clause: Clause):
+        """Sorted row positions with a term matching clause."""
+        fields = [clause.field] if clause.field else list(self.postings)
+        matches = []
+        for field in fields:
+            terms = self.postings.get(field, {})
+            if clause.exact:
+                if clause.term in terms:
+                    matches.append(terms[clause.term])
+            else:
+                matches.extend(terms[t] for t in self.vocabulary[field] if clause.term in t)
+        if not matches:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(matches))
+
+    def search(self, query):
+        """Row positions (sorted) matching every clause of query (a string or list of Clauses)."""
+        clauses = parse_query(query) if isinstance(query, str) else list(query)
+        if not clauses:
+            return np.empty(0, dtype=np.intp)
+        rows = None
+        for clause in clauses:
+            found = self.lookup(clause)
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+    def matching_terms(self, clause: Clause, limit: int = 20):
+        """(field, term) pairs clause matches, for showing what a query expanded to."""
+        fields = [clause.field] if clause.field else sorted(self.postings)
+        found = []
+        for field in fields:
+            for term in self.vocabulary.get(field, []):
+                if (term == clause.term) if clause.exact else (clause.term in term):
+                    found.append((field, term))
+                    if len(found) >= limit:
+                        return found
+        return found
@@ -0,0 +1,122 @@
+import os
+import json
+
+from fileio import atomic_write
+
+# No numpy / pandas here: SHOW_ALL, page_count and SelectorLists are needed before the
+# table (and its libraries) are loaded.
+SHOW_ALL = "show all"
+SELECTORS_FILE = "selectors.json"
+NO_ROWS = range(0)
+
+class SelectionIndex:
+    """
+    PMID / participant lookups for one version of the submissions table, built once so
+    each widget interaction costs O(selection) instead of a boolean scan over the table.
+    All row positions are positional (usable with df.iloc and the blob stores).
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        # IDs may be categorical: observed=True skips categories with no rows left
+        self.by_pmid = df.groupby("publication_id", sort=True, observed=True).indices
+        self.by_participant = df.groupby("participant_id", sort=True, observed=True).indices
+        self.by_pair = df.groupby(["publication_id", "participant_id"], sort=True, observed=True).indices
+
+        self.pmids = sorted(self.by_pmid)
+        self.participants = sorted(self.by_participant)
+        self._participants_by_pmid = {}
+        for pmid, participant in self.by_pair:
+            self._participants_by_pmid.setdefault(pmid, []).append(participant)
+
+    def participants_for(self, pmid: str):
+        """Sorted participant IDs that annotated pmid (all participants for SHOW_ALL)."""
+        if pmid == SHOW_ALL:
+            return self.participants
+        return self._participants_by_pmid.get(pmid, [])
+
+    def rows(self, pmid: str, participant: str):
+        """Row positions matching the selection, in table order (a range for show all / show all)."""
+        if pmid == SHOW_ALL and participant == SHOW_ALL:
+            return range(self.n_rows)
+        if participant == SHOW_ALL:
+            return self.by_pmid.get(pmid, NO_ROWS)
+        if pmid == SHOW_ALL:
+            return self.by_participant.get(participant, NO_ROWS)
+        return self.by_pair.get((pmid, participant), NO_ROWS)
+
+    def page(self, pmid: str, participant: str, page: int, page_size: int):
+        """
+        Returns (row positions on 1-based page, total matching rows).
+        Slicing a range / ndarray view is O(1), so any page is as cheap as the first.
+        """
+        rows = self.rows(pmid, participant)
+        start = (max(1, page) - 1) * page_size
+        return rows[start:start + page_size], len(rows)
+
+def page_count(total: int, page_size: int):
+    return max(1, -(-total // page_size))
+
+# ----------------------------
+# Lightweight selector lists (drawn before the table is loaded)
+# ----------------------------
+def input_key(*paths):
+    """Cheap fingerprint of input files (path, mtime, size; None for missing ones), from stat calls only."""
+    key = []
+    for path in paths:
+        if path and os.path.exists(path):
+            st_ = os.stat(path)
+            key.append([os.path.abspath(path), st_.st_mtime_ns, st_.st_size])
+        else:
+            key.append(None)
+    return json.dumps(key)
+
+class SelectorLists:
+    """
+    Just what the PMID / participant selectboxes need (the pmids, participants and
+    participants_for of a SelectionIndex), saved as a small JSON file next to the table
+    so a fresh replica can draw the selectors before loading pandas or the table.
+    """
+
+    def __init__(self, pmids: list, participants: list, participants_by_pmid: dict):
+        self.pmids = pmids
+        self.participants = participants
+        self._participants_by_pmid = participants_by_pmid
+
+    @classmethod
+    def from_index(cls, index: SelectionIndex):
+        return cls(list(index.pmids), list(index.participants), {pmid: list(p) for pmid, p in index._participants_by_pmid.items()})
+
+    def participants_for(self, pmid: str):
+        if pmid == SHOW_ALL:
+            return self.participants
+        return self._participants_by_pmid.get(pmid, [])
+
+    def __eq__(self, other):
+        if not isinstance(other, (SelectorLists, SelectionIndex)):
+            return NotImplemented
+        return (self.pmids, self.participants, self._participants_by_pmid) == (
+            other.pmids, other.participants, other._participants_by_pmid
+        )
+
+    def save(self, directory: str, key: str):
+        """Writes the lists for inputs key (see input_key) to directory, atomically; best effort."""
+        path = os.path.join(directory, SELECTORS_FILE)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with atomic_write(path, "w") as fh:
+                json.dump({"key": key, "pmids": self.pmids, "participants": self.participants, "by_pmid": self._participants_by_pmid}, fh)
+        except OSError:
+            pass
+
+    @classmethod
+    def load(cls, directory: str, key: str):
+        """The lists saved in directory for inputs key, or None when missing or saved for other inputs."""
+        try:
+            with open(os.path.join(directory, SELECTORS_FILE)) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if data.get("key") != key:
+            return None
+        return cls(data["pmids"], data["participants"], data["by_pmid"])
@@ -0,0 +1,24 @@
+# Where the app and the offline tools find their data. Every path can be set from the
+# environment, so replicas can mount the export anywhere without a code change.
+# Imports nothing heavy: the app reads these before pandas is loaded.
+import os
+
+DATA_DIR = os.environ.get("EXTRACTOR_DATA_DIR", "data")
+CSV_FILE = os.environ.get("EXTRACTOR_CSV") or os.path.join(DATA_DIR, "processed_submissions.csv")
+CACHE_DIR = os.environ.get("EXTRACTOR_CACHE_DIR") or os.path.join(DATA_DIR, ".cache")
+BUNDLE_DIR = os.environ.get("EXTRACTOR_BUNDLE") or os.path.join(DATA_DIR, "bundle")
+BUNDLE_MANIFEST = "bundle.json"
+# Table versions kept, in memory (appdata) and on disk (datastore): the current one plus the
+# previous one, whose stores sessions still rendering it memory-map lazily
+VERSIONS_KEPT = 2
+# Explicit blacklist workbook; by default the first of BLACKLIST_CANDIDATES that exists
+BLACKLIST_FILE = os.environ.get("EXTRACTOR_BLACKLIST") or None
+BLACKLIST_CANDIDATES = [
+    "participant_blacklist.xlsx",
+    os.path.join(DATA_DIR, "participant_blacklist.xlsx"),
+]
+
+def find_blacklist_path():
+    if BLACKLIST_FILE:
+        return BLACKLIST_FILE if os.path.exists(BLACKLIST_FILE) else None
+    return next((p for p in BLACKLIST_CANDIDATES if os.path.exists(p)), None)
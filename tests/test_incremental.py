@@ -0,0 +1,67 @@
+# Incremental ingest of appended CSV rows (datastore._ingest_appended): whatever is appended,
+# and whenever, the cached table must end up equal to a full rebuild of the same CSV.
+import os
+
+import pandas as pd
+import pytest
+
+import datastore
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "processed_submissions.csv")
+
+@pytest.fixture(scope="module")
+def lines():
+    # the export has one record per line
+    with open(SOURCE_CSV, "rb") as fh:
+        return fh.read().splitlines(keepends=True)
+
+def _write(path, data, mode="wb"):
+    with open(path, mode) as fh:
+        fh.write(data)
+
+def _load(csv_file, cache_dir):
+    return datastore.load_submissions_index(csv_file, "", str(cache_dir))
+
+def assert_same_table(actual, expected):
+    pd.testing.assert_frame_equal(actual.df.astype(object), expected.df.astype(object))
+    for store in ("blobs", "protocols", "summaries"):
+        assert getattr(actual, store).take(actual.df.index) == getattr(expected, store).take(expected.df.index)
+
+def _append_during_build(monkeypatch, csv_file, data):
+    """Appends data to csv_file right after the next batch of rows is parsed, before anything is written."""
+    build_parts = datastore._build_parts
+    pending = [data]
+
+    def build_then_append(*args, **kwargs):
+        parts = build_parts(*args, **kwargs)
+        if pending:
+            _write(csv_file, pending.pop(), "ab")
+        return parts
+
+    monkeypatch.setattr(datastore, "_build_parts", build_then_append)
+
+@pytest.mark.parametrize("cached_first", [False, True], ids=["full-build", "incremental"])
+def test_rows_appended_while_loading_are_ingested_later(tmp_path, monkeypatch, lines, cached_first):
+    csv_file = tmp_path / "submissions.csv"
+    _write(csv_file, b"".join(lines[:301]))
+    if cached_first:
+        _load(csv_file, tmp_path / "cache")
+        _write(csv_file, b"".join(lines[301:351]), "ab")
+
+    _append_during_build(monkeypatch, csv_file, b"".join(lines[351:401]))
+    _load(csv_file, tmp_path / "cache")
+    monkeypatch.undo()
+    _write(csv_file, b"".join(lines[401:]), "ab")
+
+    assert_same_table(_load(csv_file, tmp_path / "cache"), _load(csv_file, tmp_path / "rebuild"))
+
+def test_partly_written_last_row_is_left_for_later(tmp_path, lines):
+    csv_file = tmp_path / "submissions.csv"
+    _write(csv_file, b"".join(lines[:301]) + lines[301][:40])
+    reference = tmp_path / "reference.csv"
+    _write(reference, b"".join(lines[:301]))
+    assert_same_table(_load(csv_file, tmp_path / "cache"), _load(reference, tmp_path / "reference-cache"))
+
+    _write(csv_file, lines[301][40:] + b"".join(lines[302:351]), "ab")
+    merged = _load(csv_file, tmp_path / "cache")
+    assert_same_table(merged, _load(csv_file, tmp_path / "rebuild"))